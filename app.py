@@ -1,6 +1,10 @@
 import streamlit as st
 from PIL import Image
 import base64
+from modules.debug_panel import render_debug_panel
+from utils.instrumentation import configure_logging, finish_trace, start_trace
+
+configure_logging()
 
 # ======================
 # ✅ Header + Logo
@@ -138,13 +142,19 @@ with st.sidebar:
 # ======================
 # ✅ Route to Pages
 # ======================
-if tab == "📅 Book Session":
-    from modules.book_session import render_book_session
-    render_book_session()
-
-elif tab == "🔁 Manage My Bookings":
-    from modules.manage_bookings import render_manage_bookings
-    render_manage_bookings()
+trace = start_trace("book_session" if tab == "📅 Book Session" else "manage_bookings")
+try:
+    if tab == "📅 Book Session":
+        from modules.book_session import render_book_session
+        render_book_session()
+
+    elif tab == "🔁 Manage My Bookings":
+        from modules.manage_bookings import render_manage_bookings
+        render_manage_bookings()
+finally:
+    # ✅ Runs even when a page calls st.stop()
+    finish_trace(trace)
+    render_debug_panel(trace)
 
 # ======================
 # Footer
@@ -0,0 +1 @@
+# benchmarks package: offline Sheets stand-in, synthetic data and the benchmark runner
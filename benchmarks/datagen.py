@@ -0,0 +1,67 @@
+import random
+from datetime import date, timedelta
+
+from benchmarks.fake_sheets import FakeSpreadsheet
+from utils.storage import BOOKING_FIELDS, SESSION_FIELDS
+
+THERAPIES = ["Physiotherapy", "Massage", "Yoga", "Counselling", "Art Therapy", "Nutrition", "Reflexology", "Music Therapy"]
+LOCATIONS = ["Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret"]
+SLOTS = [
+    ("08:00 AM", "09:00 AM"), ("09:00 AM", "10:00 AM"), ("10:00 AM", "11:00 AM"), ("10:30 AM", "11:30 AM"),
+    ("11:00 AM", "12:00 PM"), ("02:00 PM", "03:00 PM"), ("03:00 PM", "04:00 PM"), ("04:00 PM", "05:00 PM")
+]
+THERAPISTS_PER_THERAPY = 6
+
+
+def make_sessions(n, start=None, seed=0):
+    """n Sessions rows (lists in SESSION_FIELDS order) with unique session keys, spread over consecutive days.
+
+    By default the days are centred on today, so roughly half the sessions (and their bookings) are past.
+    """
+    rng = random.Random(seed)
+    therapists = [(therapy, f"{therapy} Therapist {i + 1}") for therapy in THERAPIES for i in range(THERAPISTS_PER_THERAPY)]
+    start = start or date.today() - timedelta(days=n // (len(therapists) * len(SLOTS)) // 2)
+
+    rows = []
+    day = 0
+    while len(rows) < n:
+        session_date = (start + timedelta(days=day)).isoformat()
+        for therapy, therapist in therapists:
+            for start_time, end_time in SLOTS:
+                if len(rows) == n:
+                    break
+                maximum = rng.randint(5, 20)
+                current = rng.randint(0, maximum)
+                rows.append([
+                    therapy, therapist, rng.choice(["Online", "Physical"]), session_date, start_time, end_time,
+                    rng.choice(LOCATIONS), maximum, current, "Full" if current >= maximum else "Available"
+                ])
+        day += 1
+    return rows
+
+
+def make_bookings(n, sessions, seed=0):
+    """n Bookings rows (lists in BOOKING_FIELDS order) against the given Sessions rows"""
+    rng = random.Random(seed)
+    phones = [f"07{rng.randrange(10 ** 8):08d}" for _ in range(max(n // 3, 1))]
+
+    rows = []
+    for i in range(n):
+        therapy, therapist, mode, session_date, start_time, end_time, location = rng.choice(sessions)[:7]
+        cancelled = rng.random() < 0.05
+        rescheduled = not cancelled and rng.random() < 0.05
+        rows.append([
+            f"Client {i}", rng.choice(["Patient", "Caregiver"]), rng.choice(["Male", "Female", "Other"]),
+            rng.choice(phones), therapy, therapist, session_date, f"{start_time} - {end_time}", location, mode,
+            f"{session_date} 08:00:00", cancelled, rescheduled, "generated" if cancelled or rescheduled else "", ""
+        ])
+    return rows
+
+
+def make_spreadsheet(n_sessions, n_bookings, latency=0.0, seed=0):
+    """FakeSpreadsheet with a generated "therapy_booking_data" first sheet and "Bookings" tab"""
+    sessions = make_sessions(n_sessions, seed=seed)
+    spreadsheet = FakeSpreadsheet(latency=latency)
+    spreadsheet.add_worksheet("therapy_booking_data", header=SESSION_FIELDS, records=sessions)
+    spreadsheet.add_worksheet("Bookings", header=BOOKING_FIELDS, records=make_bookings(n_bookings, sessions, seed))
+    return spreadsheet
@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import Counter
+
+import gspread
+from gspread.utils import a1_range_to_grid_range, a1_to_rowcol, numericise_all
+
+
+def _stored(value):
+    """What the sheet keeps for a RAW write, as read back in FORMATTED_VALUE mode"""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    return "" if value is None else str(value)
+
+
+class Cell:
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeWorksheet:
+    """In-memory worksheet that mimics the gspread calls the app makes, with injected latency"""
+
+    def __init__(self, spreadsheet, title, header, rows=()):
+        self.spreadsheet = spreadsheet
+        self.id = len(spreadsheet._worksheets)
+        self.title = title
+        # ✅ A tab created without a header is empty, so its first append lands on row 1 like the API's
+        self.values = ([list(header)] if header else []) + [[_stored(value) for value in row] for row in rows]
+
+    def _call(self, operation):
+        self.spreadsheet._call(self.title, operation)
+
+    def _cell_value(self, row, col):
+        if row > len(self.values):
+            return ""
+        values = self.values[row - 1]
+        return values[col - 1] if col <= len(values) else ""
+
+    def _set_cell(self, row, col, value):
+        while len(self.values) < row:
+            self.values.append([])
+        values = self.values[row - 1]
+        values.extend([""] * (col - len(values)))
+        values[col - 1] = _stored(value)
+
+    def get_all_records(self):
+        self._call("get_all_records")
+        header = self.values[0]
+        # ✅ gspread numericises cell strings the same way
+        return [
+            dict(zip(header, numericise_all(row + [""] * (len(header) - len(row)))))
+            for row in self.values[1:]
+        ]
+
+    def get_all_values(self):
+        self._call("get_all_values")
+        return [list(row) for row in self.values]
+
+    def row_values(self, row):
+        self._call("row_values")
+        return list(self.values[row - 1]) if row <= len(self.values) else []
+
+    def acell(self, label):
+        self._call("acell")
+        return Cell(self._cell_value(*a1_to_rowcol(label)))
+
+    def update(self, range_name, values):
+        self._call("update")
+        self._write(range_name, values)
+
+    def _write(self, range_name, values):
+        row, col = a1_to_rowcol(range_name.split(":")[0])
+        for r, row_values in enumerate(values):
+            for c, value in enumerate(row_values):
+                self._set_cell(row + r, col + c, value)
+
+    def batch_update(self, data, **kwargs):
+        self._call("batch_update")
+        with self.spreadsheet.lock:
+            for item in data:
+                self._write(item["range"], item["values"])
+
+    def append_row(self, values, **kwargs):
+        self._call("append_row")
+        with self.spreadsheet.lock:
+            self.values.append([_stored(value) for value in values])
+            row = len(self.values)
+        return {"updates": {"updatedRange": f"{self.title}!A{row}:{row}"}}
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows")
+        with self.spreadsheet.lock:
+            first = len(self.values) + 1
+            self.values.extend([_stored(value) for value in row] for row in values)
+            row = len(self.values)
+        return {"updates": {"updatedRange": f"{self.title}!A{first}:{row}"}}
+
+    @property
+    def row_count(self):
+        return len(self.values)
+
+
+class FakeSpreadsheet:
+    """Spreadsheet stand-in holding FakeWorksheets; counts every API call by (worksheet, operation)"""
+
+    def __init__(self, latency=0.0):
+        self.id = "fake-spreadsheet"
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self._worksheets = []
+
+    def _call(self, title, operation):
+        with self.lock:
+            self.calls[(title, operation)] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def reset_calls(self):
+        with self.lock:
+            self.calls.clear()
+
+    def add_worksheet(self, title, rows=None, cols=None, header=(), records=()):
+        worksheet = FakeWorksheet(self, title, header, records)
+        self._worksheets.append(worksheet)
+        return worksheet
+
+    @property
+    def sheet1(self):
+        self._call(None, "fetch_sheet_metadata")
+        return self._worksheets[0]
+
+    def worksheet(self, title):
+        self._call(None, "fetch_sheet_metadata")
+        for worksheet in self._worksheets:
+            if worksheet.title == title:
+                return worksheet
+        raise gspread.WorksheetNotFound(title)
+
+    def _worksheet_named(self, title):
+        return next(w for w in self._worksheets if w.title == title.strip("'"))
+
+    def values_batch_get(self, ranges, params=None):
+        self._call(None, "values_batch_get")
+        value_ranges = []
+        for range_name in ranges:
+            title, a1 = range_name.rsplit("!", 1)
+            worksheet = self._worksheet_named(title)
+            grid = a1_range_to_grid_range(a1)
+            rows = worksheet.values[grid.get("startRowIndex", 0):grid.get("endRowIndex")]
+            values = [row[grid.get("startColumnIndex", 0):grid.get("endColumnIndex")] for row in rows]
+            if (params or {}).get("majorDimension") == "COLUMNS":
+                width = max(map(len, values), default=0)
+                values = [[row[i] if i < len(row) else "" for row in values] for i in range(width)]
+            # ✅ Like the API: trailing empty cells and rows (or columns) are left out
+            values = [row[:max((i + 1 for i, value in enumerate(row) if value != ""), default=0)] for row in values]
+            while values and not values[-1]:
+                values.pop()
+            value_range = {"range": range_name}
+            if values:
+                value_range["values"] = values
+            value_ranges.append(value_range)
+        return {"valueRanges": value_ranges}
+
+    def batch_update(self, body):
+        self._call(None, "batch_update")
+        with self.lock:
+            for request in body["requests"]:
+                grid = request["deleteDimension"]["range"]
+                worksheet = next(w for w in self._worksheets if w.id == grid["sheetId"])
+                del worksheet.values[grid["startIndex"]:grid["endIndex"]]
+
+    def values_batch_update(self, body):
+        self._call(None, "values_batch_update")
+        with self.lock:
+            for data in body["data"]:
+                title, range_name = data["range"].rsplit("!", 1)
+                worksheet = self._worksheet_named(title)
+                worksheet._write(range_name, data["values"])
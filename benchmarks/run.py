@@ -0,0 +1,313 @@
+"""Offline benchmarks of the Sheets data path against an in-memory stand-in.
+
+    python -m benchmarks.run --sessions 1000 --bookings 100000 --latency 0.05
+
+Reports Sheets API calls, wall time and (with --memory) peak Python memory per operation.
+Memory tracing slows Python code several times over, so wall times are only comparable between
+runs made with the same flags.
+"""
+import argparse
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from benchmarks.datagen import make_spreadsheet
+from utils.archive import archive_bookings
+from utils.booking import book_session, cancel_booking, reschedule_booking, save_booking
+from utils.cache import expire, invalidate
+from utils.filters import facet_filter
+from utils.gsheet import (
+    BOOKINGS, SESSIONS, find_overlapping_bookings, get_bookings, get_connection, get_sessions, get_worksheet,
+    set_connection
+)
+from utils.labels import session_labels
+from utils.local_shared_state import LocalSharedState
+from utils.reconcile import reconcile
+from utils.scheduler import QuotaScheduler, set_scheduler
+from utils.shared_state import set_shared_state
+from utils.snapshot_store import SnapshotStore, set_snapshot_store
+from utils.sqlite_storage import SQLiteStorage, generated_frames, sheet_frames
+
+
+def measure(spreadsheet, operation, trace_memory=False):
+    """Run operation() once; returns (result, API calls, wall seconds, peak bytes or None)"""
+    spreadsheet.reset_calls()
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = operation()
+    finally:
+        wall = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+    return result, dict(spreadsheet.calls), wall, peak
+
+
+def _open_session(sessions):
+    available = sessions[sessions["Current Attendees"] < sessions["Maximum Attendees"]]
+    return available.index[0]
+
+
+def _active_booking():
+    bookings = get_bookings()
+    active = bookings[~bookings["is_cancelled"] & ~bookings["is_rescheduled"]]
+    row = active.iloc[-1]
+    return get_bookings(phone=row["Phone"]).loc[active.index[-1]]
+
+
+def stress_reservations(spreadsheet, capacity=10, clients=50):
+    """Fire clients parallel bookings at one session with capacity seats; checks nothing is lost or overbooked"""
+    sheet = get_worksheet()
+    sessions = get_sessions(sheet)
+    session_index = sessions.index[0]
+    header = sheet.values[0]
+    for column, value in (("Maximum Attendees", capacity), ("Current Attendees", 0)):
+        sheet._set_cell(session_index + 2, header.index(column) + 1, value)
+    invalidate()
+    sessions = get_sessions(sheet)
+
+    results = []
+    barrier = threading.Barrier(clients)
+
+    def client():
+        barrier.wait()
+        results.append(book_session(sheet, sessions.copy(), session_index))
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    booked = results.count("Success")
+    seats = int(sheet.values[session_index + 1][header.index("Current Attendees")])
+    assert booked == min(capacity, clients), f"{booked} bookings succeeded for {capacity} seats"
+    assert seats == booked, f"sheet shows {seats} attendees after {booked} successful bookings"
+    return f"{booked}/{clients} booked, {seats}/{capacity} seats"
+
+
+def with_shared_state(operation):
+    """operation() run with a fresh LocalSharedState, as one of several replicas on a box would"""
+    def run():
+        with tempfile.TemporaryDirectory() as directory:
+            shared = LocalSharedState(directory)
+            set_shared_state(shared)
+            try:
+                return operation(shared)
+            finally:
+                set_shared_state(None)
+    return run
+
+
+def thundering_herd(sheet, clients=50):
+    """clients page loads hitting a cold Sessions cache at once; all should share a single fetch"""
+    invalidate(SESSIONS)
+    barrier = threading.Barrier(clients)
+    sizes = []
+
+    def client():
+        barrier.wait()
+        sizes.append(len(get_sessions(sheet)))
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return f"{len(sizes)} readers, {len(set(sizes))} distinct snapshot size(s)"
+
+
+def coalesced_reads(spreadsheet, clients=20, latency=0.05):
+    """clients identical values_batch_get calls at once; checks they share a single API call"""
+    ranges = [f"'{BOOKINGS}'!A:A", f"'{BOOKINGS}'!C:C"]
+    params = {"majorDimension": "COLUMNS"}
+    barrier = threading.Barrier(clients)
+    saved_latency, spreadsheet.latency = spreadsheet.latency, max(spreadsheet.latency, latency)
+
+    def client():
+        barrier.wait()
+        get_connection()[1].values_batch_get(ranges, params=params)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        spreadsheet.latency = saved_latency
+    calls = spreadsheet.calls[(None, "values_batch_get")]
+    assert calls == 1, f"{clients} identical reads made {calls} API calls"
+    return f"{clients} readers, {calls} API call"
+
+
+def sqlite_operations(n_sessions, n_bookings, directory):
+    """The SQLite backend's import and hot path, on the same generated data as the fake spreadsheet"""
+    storage = SQLiteStorage(f"{directory}/faraja.db")
+
+    def import_generated():
+        sessions, bookings = generated_frames(n_sessions, n_bookings)
+        storage.import_sessions(sessions)
+        storage.import_bookings(bookings)
+        return f"{len(sessions):,} sessions, {len(bookings):,} bookings"
+
+    def import_sheet():
+        # Through the app's own Sheets reads, as python -m utils.sqlite_storage does
+        sessions, bookings = sheet_frames()
+        storage.clear()
+        storage.import_sessions(sessions)
+        storage.import_bookings(bookings)
+        return f"{len(sessions):,} sessions, {len(bookings):,} bookings"
+
+    def book():
+        sessions = storage.list_sessions()
+        return storage.book(_open_session(sessions), "Bench", "Other", "Patient", "0700000000")
+
+    def cancel():
+        # The booking just made above
+        bookings = storage.list_bookings(phone="0700000000")
+        active = bookings[~bookings["is_cancelled"] & ~bookings["is_rescheduled"]]
+        return storage.cancel(active.iloc[-1], "benchmark")
+
+    return [
+        ("sqlite: import (generated)", import_generated),
+        ("sqlite: import (from sheet)", import_sheet),
+        ("sqlite: list_sessions", lambda: f"{len(storage.list_sessions()):,} sessions"),
+        ("sqlite: bookings by phone", lambda: f"{len(storage.list_bookings(phone='0700000000'))} rows"),
+        ("sqlite: book", book),
+        ("sqlite: cancel", cancel),
+    ]
+
+
+def run(n_sessions, n_bookings, latency, trace_memory=False, quota=0):
+    set_scheduler(QuotaScheduler(reads_per_minute=quota, writes_per_minute=quota))
+    set_snapshot_store(None)  # ✅ every cold case downloads; the warm start case brings its own store
+    set_shared_state(None)
+    spreadsheet = make_spreadsheet(n_sessions, n_bookings, latency)
+    set_connection(None, spreadsheet)
+    invalidate()
+    sheet = get_worksheet()
+    today = date.today()
+
+    def cold_sessions():
+        invalidate(SESSIONS)
+        return get_sessions(sheet)
+
+    def cold_bookings():
+        invalidate(BOOKINGS)
+        return get_bookings()
+
+    def delta_bookings():
+        # A booking made by another replica, then a read of the now stale snapshot
+        bookings_sheet = spreadsheet.worksheet(BOOKINGS)
+        bookings_sheet.values.append(list(bookings_sheet.values[-1]))
+        spreadsheet.reset_calls()
+        expire(BOOKINGS)
+        return get_bookings()
+
+    def warm_start():
+        # A restarted worker: empty memory cache, snapshots saved to disk by the process before it
+        with tempfile.TemporaryDirectory() as directory:
+            store = SnapshotStore(directory)
+            store.save(SESSIONS, get_sessions(sheet), spreadsheet.id)
+            store.save(BOOKINGS, get_bookings(), spreadsheet.id, full_sync_at=time.time())
+            set_snapshot_store(store)
+            set_connection(None, spreadsheet)
+            invalidate()
+            spreadsheet.reset_calls()
+            try:
+                return f"{len(get_sessions(sheet)):,} sessions, {len(get_bookings()):,} bookings"
+            finally:
+                set_snapshot_store(None)
+
+    def replica_cold_read(shared):
+        # Another replica published both snapshots a moment ago; this one starts with an empty cache
+        sessions, bookings = get_sessions(sheet), get_bookings()
+        invalidate()
+        shared.save_snapshot(SESSIONS, sessions, spreadsheet.id, time.time())
+        shared.save_snapshot(BOOKINGS, bookings, spreadsheet.id, time.time(), full_sync_at=time.time())
+        spreadsheet.reset_calls()
+        return f"{len(get_sessions(sheet)):,} sessions, {len(get_bookings()):,} bookings"
+
+    def conflict_check():
+        # The book page's check: does any active booking of this phone overlap the chosen session?
+        session, phone = get_sessions(sheet).iloc[0], _active_booking()["Phone"]
+        overlapping = find_overlapping_bookings(phone, session["Starts At"], session["Ends At"])
+        return f"{len(overlapping)} overlapping"
+
+    def filter_pipeline():
+        df = get_sessions(sheet)
+        row_ids, counts = facet_filter(df, {"Booking Status": "Available"}, today, today + timedelta(days=30))
+        return session_labels(df.loc[row_ids])
+
+    def book():
+        sessions = get_sessions(sheet)
+        return book_session(sheet, sessions, _open_session(sessions))
+
+    def save():
+        sessions = get_sessions(sheet)
+        save_booking(spreadsheet, "Bench", "Other", "Patient", "0700000000", sessions.iloc[0])
+
+    def cancel():
+        cancel_booking(spreadsheet, _active_booking(), "benchmark")
+
+    def reschedule():
+        sessions = get_sessions(sheet)
+        reschedule_booking(spreadsheet, _active_booking(), "benchmark", sessions.loc[_open_session(sessions)])
+
+    operations = [
+        ("get_sessions (cold)", cold_sessions),
+        ("get_sessions (warm)", lambda: get_sessions(sheet)),
+        ("get_sessions (50 cold readers)", lambda: thundering_herd(sheet)),
+        ("20 identical reads at once", lambda: coalesced_reads(spreadsheet)),
+        ("get_bookings (cold)", cold_bookings),
+        ("get_bookings (delta, 1 new row)", delta_bookings),
+        ("warm start from disk", warm_start),
+        ("replica cold read (shared)", with_shared_state(replica_cold_read)),
+        ("get_bookings by phone (warm)", lambda: get_bookings(phone="0700000000")),
+        ("conflict check (overlap)", conflict_check),
+        ("filter pipeline", filter_pipeline),
+        ("book_session", book),
+        ("save_booking", save),
+        ("cancel_booking", cancel),
+        ("reschedule_booking", reschedule),
+        ("parallel reservations", lambda: stress_reservations(spreadsheet)),
+        ("parallel reservations (shared)", with_shared_state(lambda shared: stress_reservations(spreadsheet))),
+        # Generated counts are random, so the first run rewrites most upcoming sessions and the second finds nothing
+        ("reconcile (drifted)", lambda: f"{len(reconcile())} fixed"),
+        ("reconcile (in sync)", lambda: f"{len(reconcile())} fixed"),
+        ("archive past bookings", lambda: f"{archive_bookings(days=0, batch_size=n_bookings)} moved"),
+        ("get_bookings (cold, archived)", cold_bookings),
+    ]
+
+    print(f"{n_sessions:,} sessions, {n_bookings:,} bookings, {latency * 1000:.0f} ms per API call")
+    print(f"{'operation':<30}{'calls':>7}{'wall ms':>11}{'peak MiB':>10}  detail")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, operation in operations + sqlite_operations(n_sessions, n_bookings, directory):
+            result, calls, wall, peak = measure(spreadsheet, operation, trace_memory)
+            detail = ", ".join(
+                f"{title or 'spreadsheet'}.{op}={n}" for (title, op), n in sorted(calls.items(), key=str)
+            )
+            if isinstance(result, str):
+                detail = f"{result}; {detail}"
+            peak = "-" if peak is None else f"{peak / 2 ** 20:.1f}"
+            print(f"{name:<30}{sum(calls.values()):>7}{wall * 1000:>11.1f}{peak:>10}  {detail}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1_000, help="rows in the Sessions sheet (1k-1M)")
+    parser.add_argument("--bookings", type=int, default=10_000, help="rows in the Bookings sheet (1k-1M)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake API call")
+    parser.add_argument("--quota", type=float, default=0, help="Sheets reads and writes per minute (0 = unlimited)")
+    parser.add_argument("--memory", action="store_true", help="trace peak Python memory per operation")
+    args = parser.parse_args()
+    run(args.sessions, args.bookings, args.latency, args.memory, args.quota)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,72 @@
 import re
 import streamlit as st
-import pandas as pd
-from utils.gsheet import connect_to_gsheet, get_sessions
-from utils.booking import book_session, save_booking
+from datetime import date
+from utils.filters import facet_filter, facet_options
+from utils.idempotency import finish_request, request_key
+from utils.indexes import SessionKey
+from utils.instrumentation import mark_phase
+from utils.labels import session_labels
+from utils.storage import get_storage
+
+# Session-state keys of the facet selectboxes, by Sessions column
+FACET_KEYS = {
+    "Faraja Center Location": "book_location",
+    "Booking Status": "book_status",
+    "Therapy Name": "book_therapy",
+    "Online or Physical": "book_format",
+}
 
 def render_book_session():
     st.subheader("Available Therapy Sessions")
 
-    client, spreadsheet, sheet = connect_to_gsheet()
+    mark_phase("connect")
+    storage = get_storage()
+    storage.connect()
 
-
-
-    if sheet is None:
-        st.error("❌ Failed to connect to Google Sheets. Please check credentials.")
-        st.stop()
-
-    df = get_sessions(sheet)
+    mark_phase("fetch")
+    df = storage.list_sessions()
     if df.empty:
         st.error("⚠ No therapy session data found.")
         st.stop()
 
-    df_filtered = df.copy()
+    # === Filters: evaluated together from the current widget state, then rendered ===
+    mark_phase("filter")
+    state = st.session_state
+    selections = {column: state.get(key, "All") for column, key in FACET_KEYS.items()}
+    # Same defaults the date inputs show before first use: today, clamped to their min_value
+    first_date = df["Date Available"].min().date()
+    start_date = state.get("book_start_date", max(date.today(), first_date))
+    end_date = state.get("book_end_date", max(date.today(), start_date))
+    row_ids, counts = facet_filter(df, selections, start_date, end_date)
+    df_filtered = df.loc[row_ids]
+
+    mark_phase("render")
+
+    def facet_selectbox(label, column):
+        facet_counts = counts[column]
+        return st.selectbox(
+            label,
+            facet_options(facet_counts, selections[column]),
+            key=FACET_KEYS[column],
+            format_func=lambda option: option if option == "All" else f"{option} ({facet_counts.get(option, 0)})"
+        )
 
     # === Filter 1: Location ===
-    location_filter = st.selectbox("📍 **Location** – Select your nearest Faraja center", ["All"] + sorted(df["Faraja Center Location"].dropna().unique()))
-    if location_filter != "All":
-        df_filtered = df_filtered[df_filtered["Faraja Center Location"] == location_filter]
+    facet_selectbox("📍 **Location** – Select your nearest Faraja center", "Faraja Center Location")
 
     # === Filter 2: Date Range ===
     st.markdown("📅 **Date Range** – Select the period you're available for therapy.")
-    start_date = st.date_input("Start Date", min_value=pd.to_datetime(df["Date Available"]).min())
-    end_date = st.date_input("End Date", min_value=start_date)
-    df_filtered = df_filtered[
-        (pd.to_datetime(df_filtered["Date Available"]) >= pd.to_datetime(start_date)) &
-        (pd.to_datetime(df_filtered["Date Available"]) <= pd.to_datetime(end_date))
-    ]
+    start_date = st.date_input("Start Date", min_value=first_date, key="book_start_date")
+    st.date_input("End Date", min_value=start_date, key="book_end_date")
 
     # === Filter 3: Booking Status ===
-    booking_status_filter = st.selectbox("📌 **Booking Status** – Only pick available sessions", ["All"] + sorted(df_filtered["Booking Status"].dropna().unique()))
-    if booking_status_filter != "All":
-        df_filtered = df_filtered[df_filtered["Booking Status"] == booking_status_filter]
+    facet_selectbox("📌 **Booking Status** – Only pick available sessions", "Booking Status")
 
     # === Filter 4: Therapy Type ===
-    therapy_filter = st.selectbox("💆 **Therapy Type** – Choose a therapy you're interested in", ["All"] + sorted(df_filtered["Therapy Name"].dropna().unique()))
-    if therapy_filter != "All":
-        df_filtered = df_filtered[df_filtered["Therapy Name"] == therapy_filter]
+    facet_selectbox("💆 **Therapy Type** – Choose a therapy you're interested in", "Therapy Name")
 
     # === Filter 5: Format ===
-    format_filter = st.selectbox("🖥️🏥 **Session Format** – Choose online or in-person", ["All"] + sorted(df_filtered["Online or Physical"].dropna().unique()))
-    if format_filter != "All":
-        df_filtered = df_filtered[df_filtered["Online or Physical"] == format_filter]
+    facet_selectbox("🖥️🏥 **Session Format** – Choose online or in-person", "Online or Physical")
 
     # === Display Filtered Sessions ===
     st.subheader("Available Sessions")
@@ -63,39 +80,28 @@ def render_book_session():
         "End Time",                     # 7
         "Faraja Center Location"        # 8
     ]
+    display_config = {"Date Available": st.column_config.DateColumn(format="YYYY-MM-DD")}
 
     if not df_filtered.empty:
-        st.dataframe(df_filtered[display_cols], hide_index=True)
+        st.dataframe(df_filtered[display_cols], hide_index=True, column_config=display_config)
     else:
         st.warning("⚠ No sessions available for the selected filters.")
         relaxed_df = df[df["Booking Status"] != "Full"]
-        relaxed_df["Date Available"] = pd.to_datetime(relaxed_df["Date Available"])
-        relaxed_df["Start Time"] = pd.to_datetime(relaxed_df["Start Time"], format="%I:%M %p", errors="coerce").dt.time
-        top_alternatives = relaxed_df.sort_values(by=["Date Available", "Start Time"]).head(3)
+        top_alternatives = relaxed_df.nsmallest(3, "Starts At")
         if not top_alternatives.empty:
             st.info("🔍 Top 3 nearest available sessions based on your filters:")
-            st.dataframe(top_alternatives[display_cols], hide_index=True)
+            st.dataframe(top_alternatives[display_cols], hide_index=True, column_config=display_config)
         else:
             st.info("😔 No similar sessions are currently available.")
 
     # === Booking Section ===
     if not df_filtered.empty:
-        df_filtered["session_display"] = df_filtered.apply(
-            lambda row: f"{row['Therapy Name']} - {row['Therapist Name']} - {row['Faraja Center Location']} - {row['Date Available']} {row['Start Time']} to {row['End Time']} (Status: {row['Booking Status']})",
-            axis=1
-        )
+        session_labels_by_id = session_labels(df_filtered)
 
         st.markdown("🎯 **Select a Session** – Choose the therapy session to book.")
-        session_selection = st.selectbox("Select a Session", df_filtered["session_display"])
-        selected_session = df_filtered[df_filtered["session_display"] == session_selection].iloc[0]
-
-        session_index = df[
-            (df["Therapy Name"] == selected_session["Therapy Name"]) &
-            (df["Therapist Name"] == selected_session["Therapist Name"]) &
-            (df["Date Available"] == selected_session["Date Available"]) &
-            (df["Start Time"] == selected_session["Start Time"]) &
-            (df["End Time"] == selected_session["End Time"])
-        ].index[0]
+        # ✅ The widget returns the row id; labels are only used for display
+        session_index = st.selectbox("Select a Session", session_labels_by_id.index, format_func=session_labels_by_id.get)
+        selected_session = df_filtered.loc[session_index]
 
         if selected_session["Booking Status"] == "Full":
             st.error("❌ This session is full.")
@@ -122,44 +128,39 @@ def render_book_session():
                         st.error("❌ Name is required.")
                     else:
                         try:
-                            bookings_sheet = spreadsheet.worksheet("Bookings")
-                            bookings_data = bookings_sheet.get_all_records()
-                            bookings_df = pd.DataFrame(bookings_data)
-
-                            bookings_df["Phone"] = bookings_df["Phone"].astype(str).str.zfill(10)
-                            session_date = pd.to_datetime(selected_session["Date Available"]).strftime("%Y-%m-%d")
-                            session_time = f"{selected_session['Start Time']} - {selected_session['End Time']}"
+                            mark_phase("fetch")
+                            # ✅ Live check of any active booking whose time overlaps this session's
+                            overlapping = storage.find_overlapping_bookings(
+                                phone, selected_session["Starts At"], selected_session["Ends At"], refresh=True
+                            )
 
                             # Prevent booking same session
-                            already_booked = bookings_df[
-                                (bookings_df["Phone"] == phone) &
-                                (bookings_df["Therapy Name"] == selected_session["Therapy Name"]) &
-                                (bookings_df["Therapist"] == selected_session["Therapist Name"]) &
-                                (bookings_df["Date"] == session_date) &
-                                (bookings_df["Time"] == session_time)
-                            ]
-
-                            if not already_booked.empty:
+                            session_key = SessionKey.from_session(selected_session)
+                            booked_keys = [SessionKey.from_booking(row) for _, row in overlapping.iterrows()]
+                            if session_key in booked_keys:
                                 st.error("❌ You already booked this session.")
                                 st.stop()
 
-                            # Prevent booking any other session at same time
-                            overlapping = bookings_df[
-                                (bookings_df["Phone"] == phone) &
-                                (bookings_df["Date"] == session_date) &
-                                (bookings_df["Time"] == session_time)
-                            ]
-
+                            # Prevent booking any other session at an overlapping time
                             if not overlapping.empty:
                                 st.error("❌ You already have another session at the same time.")
                                 st.stop()
 
-                            status = book_session(sheet, df, session_index)
+                            mark_phase("write")
+                            # ✅ Resubmitting after a failure or timeout resumes this booking instead of repeating it
+                            key = request_key("book", session_index, phone)
+                            status = storage.book(
+                                session_index, name, gender, attendee_type, phone, alt_phone, request_key=key
+                            )
+                            if status in ("Success", "Full"):
+                                finish_request(key)  # only an "Error" is retried under the same key
+                            mark_phase("render")
                             if status == "Success":
-                                save_booking(spreadsheet, name, gender, attendee_type, phone, df.loc[session_index], alt_phone)
                                 st.success("✅ Booking confirmed!")
-                            else:
+                            elif status == "Full":
                                 st.error("❌ This session is already full.")
+                            else:
+                                st.error("❌ Error during booking. Please try again.")
                         except Exception as e:
                             st.error("❌ Error during booking.")
                             st.text(str(e))
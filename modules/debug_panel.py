@@ -0,0 +1,33 @@
+import pandas as pd
+import streamlit as st
+from utils.config import get_setting
+from utils.instrumentation import get_totals
+
+
+def is_admin():
+    """True when the page was opened with ?debug=<[admin] debug_token>"""
+    token = get_setting("admin", "debug_token")
+    return bool(token) and st.query_params.get("debug") == str(token)
+
+
+def render_debug_panel(trace):
+    """Sidebar breakdown of this rerun's phases and Sheets calls, plus process totals (admins only)"""
+    if trace is None or not is_admin():
+        return
+
+    with st.sidebar.expander("🛠 Sheets API debug", expanded=True):
+        record = trace.as_record()
+        st.markdown(f"**This rerun** – `{record['page']}`: {record['total_ms']:.0f} ms, {record['api_calls']} API calls")
+        st.dataframe(
+            pd.DataFrame({"phase": list(record["phases_ms"]), "ms": list(record["phases_ms"].values())}),
+            hide_index=True
+        )
+        if record["calls"]:
+            st.dataframe(pd.DataFrame(record["calls"]), hide_index=True)
+
+        st.markdown("**Since process start**")
+        totals = get_totals().rows()
+        if totals:
+            st.dataframe(pd.DataFrame(totals), hide_index=True)
+        else:
+            st.caption("No Sheets calls yet.")
@@ -1,8 +1,10 @@
 import streamlit as st
 import pandas as pd
 import re
-from utils.gsheet import connect_to_gsheet
-from utils.booking import cancel_booking, save_booking
+from utils.idempotency import finish_request, request_key
+from utils.instrumentation import mark_phase
+from utils.labels import booking_labels, reschedule_labels
+from utils.storage import get_storage
 
 
 def is_valid_kenyan_phone(phone):
@@ -21,16 +23,14 @@ def render_manage_bookings():
 
     if phone_lookup:
         try:
-            client, spreadsheet, sheet = connect_to_gsheet()
+            mark_phase("connect")
+            storage = get_storage()
+            storage.connect()
 
+            mark_phase("fetch")
+            bookings_df = storage.list_bookings(phone=phone_lookup)  # typed: padded phones, datetime dates
 
-
-            bookings_sheet = spreadsheet.worksheet("Bookings")
-            bookings_data = bookings_sheet.get_all_records()
-            bookings_df = pd.DataFrame(bookings_data)
-
-            bookings_df["Phone"] = bookings_df["Phone"].astype(str).str.zfill(10)
-            bookings_df["Date"] = pd.to_datetime(bookings_df["Date"].astype(str).str.strip(), format="%Y-%m-%d", errors="coerce")
+            mark_phase("filter")
             today = pd.to_datetime(pd.Timestamp.today().date())
             upcoming_bookings = bookings_df[
                 (bookings_df["Phone"] == phone_lookup) &
@@ -38,6 +38,25 @@ def render_manage_bookings():
                 (bookings_df["is_cancelled"] != True)
             ]
 
+            # ✅ Confirmed, but the write to the sheet was given up afterwards: say so instead of hiding it
+            failed_writes = storage.list_failed_writes(phone_lookup)
+            failed_writes = failed_writes[failed_writes["Date"] >= today]
+            if not failed_writes.empty:
+                st.error("❌ These confirmed changes could not be saved. Please book or try again.")
+                st.dataframe(failed_writes, hide_index=True)
+
+            if st.checkbox("📜 Show my past bookings"):
+                # ✅ Only read on request: archived history stays off the hot path
+                past_bookings = pd.concat([
+                    bookings_df[bookings_df["Date"] < today], storage.list_archived_bookings(phone=phone_lookup)
+                ])
+                st.dataframe(
+                    past_bookings.sort_values("Date", ascending=False)[
+                        ["Date", "Time", "Therapy Name", "Therapist", "is_cancelled", "is_rescheduled", "reason"]
+                    ],
+                    hide_index=True
+                )
+
             if upcoming_bookings.empty:
                 st.warning("No upcoming bookings found for this number.")
                 return
@@ -50,18 +69,16 @@ def render_manage_bookings():
             selected_therapist = st.selectbox("Select Therapist", ["All"] + therapists)
             filtered_by_therapist = filtered_by_therapy if selected_therapist == "All" else filtered_by_therapy[filtered_by_therapy["Therapist"] == selected_therapist]
 
-            session_options = filtered_by_therapist.apply(
-                lambda row: f"{row['Therapy Name']} with {row['Therapist']} on {row['Date'].date()} at {row['Time']}",
-                axis=1
-            ).tolist()
+            mark_phase("render")
+            session_options = booking_labels(filtered_by_therapist)
 
-            if not session_options:
+            if session_options.empty:
                 st.warning("No matching sessions found with selected filters.")
                 return
 
-            selected_session_label = st.selectbox("Select a session to manage", session_options)
-            selected_session_index = session_options.index(selected_session_label)
-            selected_session = filtered_by_therapist.iloc[selected_session_index]
+            selected_booking_id = st.selectbox("Select a session to manage", session_options.index, format_func=session_options.get)
+            selected_session_label = session_options[selected_booking_id]
+            selected_session = filtered_by_therapist.loc[selected_booking_id]
 
             action = st.radio("What would you like to do?", ["Cancel", "Reschedule"])
 
@@ -70,16 +87,25 @@ def render_manage_bookings():
                 if not reason.strip():
                     st.error("Please provide a reason for cancellation.")
                 elif st.button("Confirm Cancellation"):
-                    cancel_booking(spreadsheet, selected_session, reason)
-                    st.success("✅ Booking cancellation saved.")
-                    st.info(f"Cancelled: {selected_session_label}\nReason: {reason}")
+                    mark_phase("write")
+                    # The booking's Timestamp too: after archiving, its label may belong to another booking
+                    key = request_key("cancel", phone_lookup, selected_booking_id, selected_session["Timestamp"])
+                    status = storage.cancel(selected_session, reason, request_key=key)
+                    if status == "Success":
+                        finish_request(key)
+                    mark_phase("render")
+                    if status == "Success":
+                        st.success("✅ Booking cancellation saved.")
+                        st.info(f"Cancelled: {selected_session_label}\nReason: {reason}")
+                    else:
+                        st.error("❌ Could not cancel this booking. Please try again.")
 
             elif action == "Reschedule":
                 st.markdown("### 📆 Select a new session")
-                session_sheet = spreadsheet.worksheet("therapy_booking_data")
-                all_sessions_df = pd.DataFrame(session_sheet.get_all_records())
+                mark_phase("fetch")
+                all_sessions_df = storage.list_sessions()
 
-                all_sessions_df["Date Available"] = pd.to_datetime(all_sessions_df["Date Available"].astype(str).str.strip(), errors="coerce")
+                mark_phase("filter")
                 all_sessions_df = all_sessions_df[all_sessions_df["Booking Status"] != "Full"]
                 all_sessions_df = all_sessions_df[all_sessions_df["Date Available"] >= today]
 
@@ -93,94 +119,41 @@ def render_manage_bookings():
                     (all_sessions_df["Date Available"] <= pd.to_datetime(end_date))
                 ]
 
-                session_dropdown = all_sessions_df.apply(
-                    lambda row: f"{row['Therapy Name']} with {row['Therapist Name']} on {row['Date Available'].date()} at {row['Start Time']} - {row['End Time']}",
-                    axis=1
-                ).tolist()
+                mark_phase("render")
+                session_dropdown = reschedule_labels(all_sessions_df)
 
-                if not session_dropdown:
+                if session_dropdown.empty:
                     st.warning("No available sessions in the selected date range.")
                     return
 
-                new_session_display = st.selectbox("Choose a new session", session_dropdown)
-                new_session = all_sessions_df.iloc[session_dropdown.index(new_session_display)]
+                new_session_id = st.selectbox("Choose a new session", session_dropdown.index, format_func=session_dropdown.get)
+                new_session_display = session_dropdown[new_session_id]
+                new_session = all_sessions_df.loc[new_session_id]
                 reason = st.text_area("Reason for rescheduling")
 
-                booked_times = bookings_df[(bookings_df["Phone"] == phone_lookup) & (bookings_df["is_cancelled"] != True) & (bookings_df["is_rescheduled"] != True)]
-                new_time_str = f"{new_session['Start Time']} - {new_session['End Time']}"
-                already_booked_time = booked_times[
-                    (booked_times["Date"] == new_session["Date Available"]) &
-                    (booked_times["Time"] == new_time_str)
-                ]
+                # ✅ Any other active booking overlapping the new time; the one being moved frees its slot
+                already_booked_time = storage.find_overlapping_bookings(
+                    phone_lookup, new_session["Starts At"], new_session["Ends At"]
+                ).drop(selected_booking_id, errors="ignore")
 
                 if not reason.strip():
                     st.error("Please provide a reason for rescheduling.")
                 elif not already_booked_time.empty:
                     st.error("❌ You already have another session booked at this date and time.")
                 elif st.button("Confirm Reschedule"):
-                    match = (
-                        (bookings_df["Phone"] == selected_session["Phone"]) &
-                        (bookings_df["Therapy Name"] == selected_session["Therapy Name"]) &
-                        (bookings_df["Therapist"] == selected_session["Therapist"]) &
-                        (bookings_df["Date"].dt.date == selected_session["Date"].date()) &
-                        (bookings_df["Time"] == selected_session["Time"])
-                    )
-                    if match.any():
-                        row_index = bookings_df[match].index[0] + 2
-                        bookings_sheet.update(f"M{row_index}", [["TRUE"]])
-                        bookings_sheet.update(f"N{row_index}", [[reason]])
-
-                    session_match_df = pd.DataFrame(session_sheet.get_all_records())
-                    session_match_df["Date Available"] = pd.to_datetime(session_match_df["Date Available"], errors="coerce")
-                    match_session = (
-                        (session_match_df["Therapy Name"] == selected_session["Therapy Name"]) &
-                        (session_match_df["Therapist Name"] == selected_session["Therapist"]) &
-                        (session_match_df["Date Available"] == selected_session["Date"]) &
-                        (session_match_df["Start Time"] == selected_session["Time"].split(" - ")[0]) &
-                        (session_match_df["End Time"] == selected_session["Time"].split(" - ")[1])
-                    )
-                    if match_session.any():
-                        idx = session_match_df[match_session].index[0]
-                        current_attendees = session_match_df.at[idx, "Current Attendees"]
-                        updated = max(int(current_attendees) - 1, 0)
-                        session_sheet.update(f"I{idx+2}", [[updated]])
-
-                        max_attendees = int(session_match_df.at[idx, "Maximum Attendees"])
-                        new_status = "Available" if updated < max_attendees else "Full"
-                        session_sheet.update(f"J{idx+2}", [[new_status]])
-
-                    # ✅ Save new session as new booking
-                    save_booking(
-                        spreadsheet,
-                        selected_session["Name"],
-                        selected_session["Gender"],
-                        selected_session["Attendee Type"],
-                        selected_session["Phone"],
-                        new_session
-                    )
-
-                    # ✅ Increment new session's attendees
-                    session_match_df = pd.DataFrame(session_sheet.get_all_records())
-                    session_match_df["Date Available"] = pd.to_datetime(session_match_df["Date Available"], errors="coerce")
-                    match_new = (
-                        (session_match_df["Therapy Name"] == new_session["Therapy Name"]) &
-                        (session_match_df["Therapist Name"] == new_session["Therapist Name"]) &
-                        (session_match_df["Date Available"] == new_session["Date Available"]) &
-                        (session_match_df["Start Time"] == new_session["Start Time"]) &
-                        (session_match_df["End Time"] == new_session["End Time"])
+                    mark_phase("write")
+                    key = request_key(
+                        "reschedule", phone_lookup, selected_booking_id, selected_session["Timestamp"], new_session_id
                     )
-                    if match_new.any():
-                        new_idx = session_match_df[match_new].index[0]
-                        raw_current = session_match_df.at[new_idx, "Current Attendees"]
-                        new_current = int(raw_current) + 1 if str(raw_current).strip().isdigit() else 1
-                        session_sheet.update(f"I{new_idx+2}", [[new_current]])
-
-                        max_cap = int(session_match_df.at[new_idx, "Maximum Attendees"])
-                        updated_status = "Full" if new_current >= max_cap else "Available"
-                        session_sheet.update(f"J{new_idx+2}", [[updated_status]])
-
-                    st.success("✅ Booking rescheduled.")
-                    st.info(f"Moved to: {new_session_display}\nReason: {reason}")
+                    status = storage.reschedule(selected_session, reason, new_session, request_key=key)
+                    if status == "Success":
+                        finish_request(key)
+                    mark_phase("render")
+                    if status == "Success":
+                        st.success("✅ Booking rescheduled.")
+                        st.info(f"Moved to: {new_session_display}\nReason: {reason}")
+                    else:
+                        st.error("❌ Could not reschedule this booking. Please try again.")
 
         except Exception as e:
             st.error("❌ Could not fetch bookings.")
@@ -0,0 +1,119 @@
+"""Move past bookings from the Bookings tab to "Bookings Archive", so every hot read stays small.
+
+    python -m utils.archive [--days N] [--batch-size N] [--dry-run]
+
+Bookings rows are addressed by position: cancels and reschedules look their row up in a fresh read, so
+only one already between that read and its write when rows above it are deleted could flag the wrong row.
+Schedule this while the app is quiet (e.g. nightly) to keep that window empty.
+"""
+import argparse
+import logging
+
+import gspread
+import pandas as pd
+
+from utils.cache import invalidate
+from utils.config import get_setting
+from utils.gsheet import (
+    ARCHIVE, BOOKINGS, ROW_IDENTITY, forget_worksheet, get_connection, get_header, get_worksheet, read_columns,
+    with_reconnect
+)
+from utils.instrumentation import configure_logging
+from utils.shared_state import get_shared_state
+
+logger = logging.getLogger("faraja.archive")
+
+DEFAULT_DAYS = 1
+DEFAULT_BATCH_SIZE = 5000
+
+# Columns telling whether a booking already reached the archive (an earlier run stopped before deleting it)
+ARCHIVE_KEY = ROW_IDENTITY + ["Phone", "Date"]
+
+
+def _archive_worksheet(header):
+    try:
+        return get_worksheet(ARCHIVE)
+    except gspread.WorksheetNotFound:
+        _, spreadsheet = get_connection()
+        worksheet = spreadsheet.add_worksheet(title=ARCHIVE, rows="1000", cols=str(len(header)))
+        worksheet.append_row(header)
+        forget_worksheet(ARCHIVE)
+        return worksheet
+
+
+def _row_runs(rows):
+    """(first, last) runs of consecutive sheet rows, bottom-most first so each deletion leaves the rest in place"""
+    runs = []
+    for row in sorted(rows):
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return [tuple(run) for run in reversed(runs)]
+
+
+def archive_bookings(days=None, batch_size=None, dry_run=False):
+    """Move up to batch_size bookings dated more than days ago to the archive tab; returns how many.
+
+    With dry_run nothing is written and the count is of every booking that is due to move.
+    """
+    days = int(get_setting("archive", "days", DEFAULT_DAYS) if days is None else days)
+    batch_size = int(get_setting("archive", "batch_size", DEFAULT_BATCH_SIZE) if batch_size is None else batch_size)
+    cutoff = pd.Timestamp.today().normalize() - pd.Timedelta(days=days)
+
+    # ✅ Raw strings of every column, so archived rows are copied exactly as they were
+    header = get_header(BOOKINGS)
+    live = read_columns(BOOKINGS, [(header, 2, None)])[0]
+    dates = pd.to_datetime(live["Date"].str.strip(), format="%Y-%m-%d", errors="coerce")
+    past = live[dates < cutoff]
+    if past.empty or dry_run:
+        return len(past)
+    past = past.head(batch_size)
+
+    archive_sheet = _archive_worksheet(header)
+    archived = read_columns(ARCHIVE, [(ARCHIVE_KEY, 2, None)])[0]
+    seen = set(archived.itertuples(index=False, name=None))
+    fresh = past[[key not in seen for key in past[ARCHIVE_KEY].itertuples(index=False, name=None)]]
+    if not fresh.empty:
+        archive_sheet.append_rows(fresh.reindex(columns=get_header(ARCHIVE), fill_value="").values.tolist())
+
+    # ✅ One request deletes every run of rows; appends made meanwhile land below them and are untouched
+    sheet_id = get_worksheet(BOOKINGS).id
+    requests = [
+        {"deleteDimension": {
+            "range": {"sheetId": sheet_id, "dimension": "ROWS", "startIndex": first - 1, "endIndex": last}
+        }}
+        for first, last in _row_runs(past.index + 2)
+    ]
+    with_reconnect(lambda spreadsheet: spreadsheet.batch_update({"requests": requests}))
+
+    # Every later row moved up: the cached snapshot (and any copy shared with other replicas) must be downloaded again
+    invalidate(BOOKINGS, ARCHIVE)
+    shared = get_shared_state()
+    if shared is not None:
+        shared.discard_snapshots(BOOKINGS)
+    logger.info(
+        f"Archived {len(past)} bookings dated before {cutoff:%Y-%m-%d} ({len(past) - len(fresh)} already copied)"
+    )
+    return len(past)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, help=f"archive bookings more than DAYS days old (default {DEFAULT_DAYS})")
+    parser.add_argument("--batch-size", type=int, help=f"rows moved per batch (default {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--dry-run", action="store_true", help="only count the bookings that would be moved")
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.dry_run:
+        logger.info(f"{archive_bookings(args.days, dry_run=True)} bookings would be archived")
+        return
+    # ✅ Batch after batch until a short one shows nothing past is left
+    batch_size = args.batch_size or int(get_setting("archive", "batch_size", DEFAULT_BATCH_SIZE))
+    while archive_bookings(args.days, batch_size) == batch_size:
+        pass
+
+
+if __name__ == "__main__":
+    main()
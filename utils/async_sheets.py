@@ -0,0 +1,45 @@
+import asyncio
+import contextvars
+import threading
+
+
+async def call(fn, *args, **kwargs):
+    """Await a blocking gspread call run in a worker thread (the page trace and write priority carry over)"""
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+async def gather(*calls):
+    """Run blocking callables concurrently; results in order, with a failed call's exception in its place"""
+    return await asyncio.gather(*(call(fn) for fn in calls), return_exceptions=True)
+
+
+def run_sync(coro):
+    """asyncio.run() for Streamlit callers; uses a helper thread if this thread is already running a loop
+
+    The helper thread runs in a copy of the caller's context, so the page trace and write priority carry over.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    outcome = {}
+    context = contextvars.copy_context()
+
+    def runner():
+        try:
+            outcome["result"] = context.run(asyncio.run, coro)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=runner, name="sheets-async-bridge")
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def run_concurrently(*calls):
+    """Run blocking callables at the same time and wait for all of them; see gather()"""
+    return run_sync(gather(*calls))
@@ -0,0 +1,32 @@
+class WriteBatch:
+    """Collect cell updates for one logical operation and flush them as one batch_update per spreadsheet"""
+
+    def __init__(self):
+        self._pending = {}  # spreadsheet id -> (spreadsheet, [value ranges])
+
+    def update(self, worksheet, cell, value):
+        """Queue value for an A1 cell (e.g. "I5") on worksheet"""
+        spreadsheet = worksheet.spreadsheet
+        _, data = self._pending.setdefault(spreadsheet.id, (spreadsheet, []))
+        data.append({"range": f"'{worksheet.title}'!{cell}", "values": [[value]]})
+
+    def __len__(self):
+        return sum(len(data) for _, data in self._pending.values())
+
+    def flush(self):
+        """Send every queued update, one request per spreadsheet"""
+        pending, self._pending = self._pending, {}
+        for spreadsheet, data in pending.values():
+            # ✅ RAW matches the default of Worksheet.update used previously
+            spreadsheet.values_batch_update({"valueInputOption": "RAW", "data": data})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # ✅ Nothing is written unless the whole operation succeeded
+        if exc_type is None:
+            self.flush()
+        else:
+            self._pending = {}
+        return False
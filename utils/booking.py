@@ -1,166 +1,366 @@
+from contextlib import ExitStack, contextmanager
+import logging
+import threading
+
 import gspread
 import pandas as pd  # Required for generating timestamps
+from utils.async_sheets import run_concurrently
+from utils.batch import WriteBatch
+from utils.cache import patch
+from utils.gsheet import (
+    BOOKING_COLUMNS, BOOKINGS, SESSION_COLUMNS, SESSIONS, add_cached_booking, cell, get_bookings, get_sessions,
+    get_session_index, get_worksheet, set_cached_booking_fields
+)
+from utils.indexes import SessionKey
+from utils.refresher import request_refresh
+from utils.scheduler import write_priority
+from utils.shared_state import get_shared_state
+from utils.storage import BOOKING_FIELDS
 
-def book_session(sheet, df, session_index):
-    try:
-        max_raw = df.at[session_index, "Maximum Attendees"]
-        max_attendees = int(max_raw) if str(max_raw).strip().isdigit() else 0
+logger = logging.getLogger("faraja.booking")
 
-        current_raw = df.at[session_index, "Current Attendees"]
-        current_attendees = int(current_raw) if str(current_raw).strip().isdigit() else 0
+class BookingNotSaved(Exception):
+    """The seat was moved but the new Bookings row could not be written"""
 
-        if current_attendees < max_attendees:
-            current_attendees += 1
-            booking_status = "Full" if current_attendees == max_attendees else "Available"
 
-            df.at[session_index, "Current Attendees"] = current_attendees
-            df.at[session_index, "Booking Status"] = booking_status
+# ✅ One lock per session row: increments in this process never interleave
+_seat_locks = {}
+_seat_locks_guard = threading.Lock()
 
-            sheet.update(f"I{session_index + 2}", [[str(current_attendees)]])
-            sheet.update(f"J{session_index + 2}", [[booking_status]])
 
-            return "Success"
+def _seat_lock(session_index):
+    with _seat_locks_guard:
+        return _seat_locks.setdefault(session_index, threading.Lock())
 
-        return "Full"
 
-    except Exception as e:
-        print(f"❌ Error updating session in Google Sheets: {e}")
-        return "Error"
+@contextmanager
+def holding_seats(*session_indexes):
+    """Hold the seat locks of several sessions, always acquired in the same order (across replicas with [shared])"""
+    session_indexes = sorted({i for i in session_indexes if i is not None})
+    shared = get_shared_state()
+    with ExitStack() as stack:
+        for session_index in session_indexes:
+            stack.enter_context(_seat_lock(session_index))
+        if shared is not None:
+            stack.enter_context(shared.holding(*session_indexes))
+        yield
 
-def save_booking(spreadsheet, name, gender, attendee_type, phone, session_details, alt_phone=None):
-    try:
-        try:
-            bookings_sheet = spreadsheet.worksheet("Bookings")
-        except gspread.WorksheetNotFound:
-            bookings_sheet = spreadsheet.add_worksheet(title="Bookings", rows="1000", cols="14")
-            bookings_sheet.append_row([
-                "Name", "Attendee Type", "Gender", "Phone", "Therapy Name",
-                "Therapist", "Date", "Time", "Faraja Center Location", "Online or Physical",
-                "Timestamp", "is_cancelled", "is_rescheduled", "reason", "Alt Phone"
-            ])
-
-        booking_data = [
-            name,
-            attendee_type,
-            gender,
-            phone,
-            session_details["Therapy Name"],
-            session_details["Therapist Name"],
-            pd.to_datetime(session_details["Date Available"]).strftime("%Y-%m-%d"),
-            f"{session_details['Start Time']} - {session_details['End Time']}",
-            session_details["Faraja Center Location"],
-            session_details["Online or Physical"],
-            pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S"),
-            False,  # is_cancelled
-            False,  # is_rescheduled
-            "",       # reason
-            alt_phone
-        ]
-
-
-        bookings_sheet.append_row(booking_data)
 
-    except Exception as e:
-        print(f"❌ Error saving booking in Google Sheets: {e}")
+def _to_int(raw):
+    return int(raw) if str(raw).strip().isdigit() else 0
 
-def cancel_booking(spreadsheet, selected_session, reason):
-    try:
-        bookings_sheet = spreadsheet.worksheet("Bookings")
-        bookings_data = bookings_sheet.get_all_records()
-        df = pd.DataFrame(bookings_data)
-
-        df["Phone"] = df["Phone"].astype(str).str.strip().str.zfill(10)
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-
-        session_match = (
-            (df["Phone"] == selected_session["Phone"]) &
-            (df["Therapy Name"] == selected_session["Therapy Name"]) &
-            (df["Therapist"] == selected_session["Therapist"]) &
-            (df["Date"].dt.date == selected_session["Date"].date()) &
-            (df["Time"] == selected_session["Time"])
-        )
-
-        if not session_match.any():
-            print("❌ No matching session found in Bookings sheet.")
-            return
 
-        row_index = df[session_match].index[0] + 2
-        bookings_sheet.update(f"L{row_index}", [["TRUE"]])
-        bookings_sheet.update(f"N{row_index}", [[reason]])
+def live_attendees(sheet, session_index):
+    """Current Attendees of a session read from the sheet, not the (possibly minutes old) snapshot"""
+    return _to_int(sheet.acell(cell(SESSION_COLUMNS, "Current Attendees", session_index + 2)).value)
 
-        session_sheet = spreadsheet.sheet1
-        sessions = pd.DataFrame(session_sheet.get_all_records())
 
-        session_row = sessions[
-            (sessions["Therapy Name"] == selected_session["Therapy Name"]) &
-            (sessions["Therapist Name"] == selected_session["Therapist"]) &
-            (sessions["Date Available"] == str(selected_session["Date"].date())) &
-            (sessions["Start Time"] == selected_session["Time"].split(" - ")[0]) &
-            (sessions["End Time"] == selected_session["Time"].split(" - ")[1])
-        ]
+@write_priority()
+def book_session(sheet, df, session_index, before_write=None):
+    """Reserve one seat, re-reading the live count under the session's lock; "Success", "Full" or "Error".
 
-        if not session_row.empty:
-            session_idx = session_row.index[0]
-            raw_attendees = sessions.at[session_idx, "Current Attendees"]
-            current_attendees = int(raw_attendees) if str(raw_attendees).strip().isdigit() else 0
+    before_write() runs under the lock just before the seat is written.
+    """
+    max_attendees = _to_int(df.at[session_index, "Maximum Attendees"])
+    row = session_index + 2
+    shared = get_shared_state()
+    key = SessionKey.from_session(df.loc[session_index])
 
-            updated_count = max(current_attendees - 1, 0)
-            max_attendees = int(sessions.at[session_idx, "Maximum Attendees"])
-            new_status = "Available" if updated_count < max_attendees else "Full"
+    def live_count():
+        # ✅ Compare against the sheet, not the (possibly minutes old) snapshot in df
+        return live_attendees(sheet, session_index)
 
-            session_sheet.update(f"I{session_idx + 2}", [[updated_count]])
-            session_sheet.update(f"J{session_idx + 2}", [[new_status]])
+    try:
+        with holding_seats(session_index):
+            if shared is None:
+                current_attendees = live_count()
+                taken = current_attendees < max_attendees
+                if taken:
+                    current_attendees += 1
+            else:
+                # ✅ One counter for every replica, read from the sheet only when it is unknown or expired
+                taken, current_attendees = shared.take_seat(key, max_attendees, live_count)
+
+            if not taken:
+                status = "Full"
+            else:
+                booking_status = "Full" if current_attendees == max_attendees else "Available"
+
+                # ✅ Absolute values, retried on 429/5xx by the scheduler: a repeat can never take a second seat.
+                # Not retried here, since a 5xx may arrive after the write landed and a re-read would count it twice.
+                try:
+                    if before_write is not None:
+                        before_write()
+                    with WriteBatch() as batch:
+                        batch.update(sheet, cell(SESSION_COLUMNS, "Current Attendees", row), str(current_attendees))
+                        batch.update(sheet, cell(SESSION_COLUMNS, "Booking Status", row), booking_status)
+                except Exception as e:
+                    code = getattr(e, "code", None)
+                    if shared is not None and isinstance(code, int) and code < 500:
+                        # A 4xx was refused outright: the seat was not written, so hand it back
+                        shared.set_seats({key: current_attendees - 1})
+                    raise
+                status = "Success"
+
+        booking_status = "Full" if current_attendees >= max_attendees else "Available"
+        df.at[session_index, "Current Attendees"] = current_attendees
+        df.at[session_index, "Booking Status"] = booking_status
+
+        # ✅ Patch the shared snapshot instead of re-downloading the sheet
+        def apply(cached):
+            cached.at[session_index, "Current Attendees"] = current_attendees
+            cached.at[session_index, "Booking Status"] = booking_status
+        patch(SESSIONS, apply)
+        if status == "Success":
+            request_refresh(SESSIONS)
+
+        return status
 
     except Exception as e:
-        print(f"❌ Error cancelling booking: {e}")
+        logger.exception(f"❌ Error updating session in Google Sheets: {e}")
+        return "Error"
 
-def reschedule_booking(spreadsheet, selected_session, reason):
+def booking_row(name, gender, attendee_type, phone, session_details, alt_phone=None):
+    """Bookings sheet row (BOOKING_FIELDS order) for a new booking of session_details"""
+    return [
+        name,
+        attendee_type,
+        gender,
+        phone,
+        session_details["Therapy Name"],
+        session_details["Therapist Name"],
+        pd.to_datetime(session_details["Date Available"]).strftime("%Y-%m-%d"),
+        f"{session_details['Start Time']} - {session_details['End Time']}",
+        session_details["Faraja Center Location"],
+        session_details["Online or Physical"],
+        pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S"),
+        False,  # is_cancelled
+        False,  # is_rescheduled
+        "",       # reason
+        alt_phone
+    ]
+
+def _cache_appended_booking(response, booking_data):
+    # ✅ Extend the cached frame and phone index instead of re-downloading Bookings
+    add_cached_booking(response, dict(zip(BOOKING_FIELDS, booking_data)))
+    request_refresh(BOOKINGS)
+
+@write_priority()
+def save_booking(spreadsheet, name, gender, attendee_type, phone, session_details, alt_phone=None):
+    """Append the booking row; returns whether it was saved"""
     try:
-        bookings_sheet = spreadsheet.worksheet("Bookings")
-        bookings_data = bookings_sheet.get_all_records()
-        df = pd.DataFrame(bookings_data)
-
-        df["Phone"] = df["Phone"].astype(str).str.strip().str.zfill(10)
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-
-        session_match = (
-            (df["Phone"] == selected_session["Phone"]) &
-            (df["Therapy Name"] == selected_session["Therapy Name"]) &
-            (df["Therapist"] == selected_session["Therapist"]) &
-            (df["Date"].dt.date == selected_session["Date"].date()) &
-            (df["Time"] == selected_session["Time"])
-        )
+        try:
+            bookings_sheet = get_worksheet("Bookings")
+        except gspread.WorksheetNotFound:
+            bookings_sheet = spreadsheet.add_worksheet(title="Bookings", rows="1000", cols="14")
+            bookings_sheet.append_row(BOOKING_FIELDS)
 
-        if not session_match.any():
-            print("❌ No matching session found in Bookings sheet.")
-            return
+        booking_data = booking_row(name, gender, attendee_type, phone, session_details, alt_phone)
+        response = bookings_sheet.append_row(booking_data)
+        _cache_appended_booking(response, booking_data)
+        return True
 
-        row_index = df[session_match].index[0] + 2
-        bookings_sheet.update(f"M{row_index}", [["TRUE"]])
-        bookings_sheet.update(f"N{row_index}", [[reason]])
+    except Exception as e:
+        logger.exception(f"❌ Error saving booking in Google Sheets: {e}")
+        return False
+
+def find_booking_row(selected_session):
+    """Return the sheet row number of the active booking in selected_session, or None.
+
+    The row's own label wins while it still holds that booking; otherwise the first matching booking that
+    is neither cancelled nor rescheduled.
+    """
+    # ✅ Rows are addressed by position and archiving deletes rows above them, so resolve against a refreshed
+    # read (the delta sync notices deleted rows and downloads again), never this process's cached snapshot
+    df = get_bookings(phone=selected_session["Phone"], refresh=True)  # only this caller's rows, via the phone index
+    if df.empty:
+        return None
+
+    # ✅ A cancelled or rescheduled row of the same session (e.g. before a rebooking) is never the one meant
+    session_match = (
+        (df["Therapy Name"] == selected_session["Therapy Name"]) &
+        (df["Therapist"] == selected_session["Therapist"]) &
+        (df["Date"].dt.date == selected_session["Date"].date()) &
+        (df["Time"] == selected_session["Time"]) &
+        ~df["is_cancelled"] & ~df["is_rescheduled"]
+    )
+
+    label = selected_session.name
+    if label is not None and label in session_match.index and session_match[label]:
+        return label + 2
+    if not session_match.any():
+        return None
+    return df[session_match].index[0] + 2
+
+def find_session_index(key):
+    """Return the Sessions DataFrame index of the session with SessionKey key, or None"""
+    return get_session_index().label(key)
+
+def _queue_attendee_change(batch, session_sheet, sessions, session_idx, delta):
+    """Queue the count and status cells for moving a session's attendee count by delta; returns both values"""
+    current_attendees = _to_int(sessions.at[session_idx, "Current Attendees"])
+
+    updated_count = max(current_attendees + delta, 0)
+    max_attendees = int(sessions.at[session_idx, "Maximum Attendees"])
+    new_status = "Available" if updated_count < max_attendees else "Full"
+
+    batch.update(session_sheet, cell(SESSION_COLUMNS, "Current Attendees", session_idx + 2), updated_count)
+    batch.update(session_sheet, cell(SESSION_COLUMNS, "Booking Status", session_idx + 2), new_status)
+    return updated_count, new_status
+
+def _patch_session_counts(changes, sessions=None):
+    """Patch {session index: (count, status)} into the Sessions snapshot and have the refresher confirm them.
+
+    With [shared] state the counts, just written to the sheet, also become the replicas' seat counters.
+    """
+    def apply(cached):
+        for idx, (count, status) in changes.items():
+            cached.at[idx, "Current Attendees"] = count
+            cached.at[idx, "Booking Status"] = status
+    patch(SESSIONS, apply)
+    request_refresh(SESSIONS)
+
+    shared = get_shared_state()
+    if shared is not None and changes:
+        if sessions is None:
+            sessions = get_session_index().frame  # keys only: the cached snapshot will do
+        shared.set_seats({
+            SessionKey.from_session(sessions.loc[idx]): count for idx, (count, _) in changes.items()
+        })
+
+@write_priority()
+def set_session_counts(sheet, changes):
+    """Overwrite {session index: (count, status)} on the sheet in one batch and in the Sessions snapshot"""
+    with WriteBatch() as batch:
+        for idx, (count, status) in changes.items():
+            batch.update(sheet, cell(SESSION_COLUMNS, "Current Attendees", idx + 2), count)
+            batch.update(sheet, cell(SESSION_COLUMNS, "Booking Status", idx + 2), status)
+    _patch_session_counts(changes)
+
+@write_priority()
+def reserve_seats(sheet, requested, before_write=None):
+    """Take up to requested[idx] seats on each session against the live counts, in one batch.
+
+    before_write() runs just before the batch is sent; returns the seats granted per session index.
+    """
+    granted = {}
+    changes = {}
+    with holding_seats(*requested):
+        sessions = get_sessions(sheet, refresh=True)  # live counts under the seat locks
+        batch = WriteBatch()
+        for idx, wanted in requested.items():
+            free = max(_to_int(sessions.at[idx, "Maximum Attendees"]) - _to_int(sessions.at[idx, "Current Attendees"]), 0)
+            granted[idx] = min(wanted, free)
+            if granted[idx]:
+                changes[idx] = _queue_attendee_change(batch, sheet, sessions, idx, granted[idx])
+        if changes:
+            if before_write is not None:
+                before_write()
+            batch.flush()
+
+    if changes:
+        _patch_session_counts(changes, sessions)
+    return granted
+
+def _void_appended_booking(bookings_sheet, response, reason):
+    """Flag a row written by append_row cancelled, undoing it when the rest of its operation failed"""
+    updated_range = response["updates"]["updatedRange"]
+    row = gspread.utils.a1_to_rowcol(updated_range.split("!")[-1].split(":")[0])[0]
+    with WriteBatch() as batch:
+        batch.update(bookings_sheet, cell(BOOKING_COLUMNS, "is_cancelled", row), "TRUE")
+        batch.update(bookings_sheet, cell(BOOKING_COLUMNS, "reason", row), reason)
+
+@write_priority()
+def _release_booking(selected_session, flag_column, reason, new_session=None, new_booking=None, before_write=None):
+    """Flag a booking row and free its seat, optionally taking a seat on new_session, in one batch.
+
+    new_booking (a Bookings row for new_session) is appended concurrently with that batch; before_write()
+    runs under the seat locks just before both are sent.
+    """
+    row_index = find_booking_row(selected_session)
+    if row_index is None:
+        logger.warning("❌ No matching session found in Bookings sheet.")
+        return False
+
+    bookings_sheet = get_worksheet("Bookings")
+    session_sheet = get_worksheet()
+
+    session_idx = find_session_index(SessionKey.from_booking(selected_session))
+    new_idx = None if new_session is None else find_session_index(SessionKey.from_session(new_session))
+
+    with holding_seats(session_idx, new_idx):
+        sessions = get_sessions(session_sheet, refresh=True)  # live counts under the seat locks
+        new_is_full = new_idx is not None and (
+            _to_int(sessions.at[new_idx, "Current Attendees"]) >= _to_int(sessions.at[new_idx, "Maximum Attendees"])
+        )
+        if new_is_full:
+            logger.warning("❌ The new session is already full.")
+            return False
+
+        changes = {}
+        batch = WriteBatch()
+        batch.update(bookings_sheet, cell(BOOKING_COLUMNS, flag_column, row_index), "TRUE")
+        batch.update(bookings_sheet, cell(BOOKING_COLUMNS, "reason", row_index), reason)
+
+        if session_idx is not None:
+            changes[session_idx] = _queue_attendee_change(batch, session_sheet, sessions, session_idx, -1)
+        if new_idx is not None:
+            changes[new_idx] = _queue_attendee_change(batch, session_sheet, sessions, new_idx, +1)
+        if before_write is not None:
+            before_write()
+
+        if new_booking is None:
+            batch.flush()
+            appended = None
+        else:
+            # ✅ Independent requests: wait for the slower of the two instead of both in turn
+            flushed, appended = run_concurrently(batch.flush, lambda: bookings_sheet.append_row(new_booking))
+            if isinstance(flushed, Exception):
+                if not isinstance(appended, Exception):
+                    _void_appended_booking(bookings_sheet, appended, "reschedule failed")
+                raise flushed
+
+    set_cached_booking_fields(row_index, {flag_column: True, "reason": reason})
+    _patch_session_counts(changes, sessions)
+    request_refresh(BOOKINGS)
+
+    if isinstance(appended, Exception):
+        raise BookingNotSaved(str(appended)) from appended
+    if appended is not None:
+        _cache_appended_booking(appended, new_booking)
+    return True
 
-        session_sheet = spreadsheet.sheet1
-        sessions = pd.DataFrame(session_sheet.get_all_records())
+def cancel_booking(spreadsheet, selected_session, reason):
+    """Flag a booking cancelled and free its seat; "Success" or "Error" """
+    try:
+        return "Success" if _release_booking(selected_session, "is_cancelled", reason) else "Error"
 
-        session_row = sessions[
-            (sessions["Therapy Name"] == selected_session["Therapy Name"]) &
-            (sessions["Therapist Name"] == selected_session["Therapist"]) &
-            (sessions["Date Available"] == str(selected_session["Date"].date())) &
-            (sessions["Start Time"] == selected_session["Time"].split(" - ")[0]) &
-            (sessions["End Time"] == selected_session["Time"].split(" - ")[1])
-        ]
+    except Exception as e:
+        logger.exception(f"❌ Error cancelling booking: {e}")
+        return "Error"
 
-        if not session_row.empty:
-            session_idx = session_row.index[0]
-            raw_attendees = sessions.at[session_idx, "Current Attendees"]
-            current_attendees = int(raw_attendees) if str(raw_attendees).strip().isdigit() else 0
+def reschedule_booking(spreadsheet, selected_session, reason, new_session=None, before_write=None):
+    """Mark a booking rescheduled; with new_session, also move the seat and save the new booking.
 
-            updated_count = max(current_attendees - 1, 0)
-            max_attendees = int(sessions.at[session_idx, "Maximum Attendees"])
-            new_status = "Available" if updated_count < max_attendees else "Full"
+    Returns "Success", "Error" (nothing changed) or "Unsaved" (seat moved, new booking row not written).
+    before_write() runs under the seat locks just before anything is written.
+    """
+    try:
+        # ✅ Save new session as new booking, in parallel with the flag and seat updates
+        new_booking = None if new_session is None else booking_row(
+            selected_session["Name"],
+            selected_session["Gender"],
+            selected_session["Attendee Type"],
+            selected_session["Phone"],
+            new_session
+        )
+        released = _release_booking(selected_session, "is_rescheduled", reason, new_session, new_booking, before_write)
+        return "Success" if released else "Error"
 
-            session_sheet.update(f"I{session_idx + 2}", [[updated_count]])
-            session_sheet.update(f"J{session_idx + 2}", [[new_status]])
+    except BookingNotSaved as e:
+        logger.exception(f"❌ Rescheduled seat but could not save the new booking: {e}")
+        return "Unsaved"
 
     except Exception as e:
-        print(f"❌ Error rescheduling booking: {e}")
+        logger.exception(f"❌ Error rescheduling booking: {e}")
+        return "Error"
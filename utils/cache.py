@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import Counter
+
+from utils.config import get_setting
+from utils.singleflight import SingleFlight
+
+DEFAULT_TTL_SECONDS = 30
+
+# ✅ Process-wide worksheet snapshots: name -> (fetched_at, value)
+_lock = threading.RLock()
+_entries = {}
+_generations = Counter()  # bumped by every patch/invalidate, so loads begun earlier never overwrite them
+_epoch = 0  # bumped by invalidate() of everything
+_ttls = {}  # name -> TTL overriding [cache] ttl_seconds, e.g. for snapshots kept warm in the background
+_changed = {}  # name -> when it was last patched, expired or invalidated
+_all_changed = float("-inf")  # when everything was last invalidated
+_loads = SingleFlight()
+
+
+def get_ttl(name=None):
+    """TTL for worksheet snapshots, configurable via [cache] ttl_seconds; with name, any set_ttl override"""
+    return _ttls.get(name) or float(get_setting("cache", "ttl_seconds", DEFAULT_TTL_SECONDS))
+
+
+def set_ttl(name, seconds):
+    """Use seconds as the TTL of snapshot name (None restores the configured default)"""
+    with _lock:
+        if seconds is None:
+            _ttls.pop(name, None)
+        else:
+            _ttls[name] = seconds
+
+
+def _load(name, loader, requested_at, update=None):
+    """Call loader() (or update(previous)) and cache the value, unless a load begun after requested_at finished"""
+    with _lock:
+        entry = _entries.get(name)
+        generation = (_epoch, _generations[name])
+    if entry and entry[0] >= requested_at:
+        return entry[1]
+
+    started = time.monotonic()
+    value = update(entry[1]) if update is not None and entry else None
+    if value is None:
+        value = loader()
+    with _lock:
+        current = _entries.get(name)
+        if (_epoch, _generations[name]) == generation and not (current and current[0] > started):
+            _entries[name] = (started, value)
+    return value
+
+
+def get_snapshot(name, loader, ttl=None, refresh=False, update=None):
+    """Return the cached snapshot for name, calling loader() when missing, stale or refresh is set.
+
+    Concurrent misses share one loader() call: the first caller loads, the rest wait for its value.
+    A refresh always starts its own load, since an in-flight one may predate the caller's writes.
+    With update, a stale (or expired) snapshot is brought up to date by update(previous) instead;
+    update returns None to fall back to a full loader() call.
+    """
+    if ttl is None:
+        ttl = get_ttl(name)
+    requested_at = time.monotonic()
+
+    with _lock:
+        entry = _entries.get(name)
+    if entry and not refresh and requested_at - entry[0] < ttl:
+        return entry[1]
+
+    if refresh:
+        return _load(name, loader, float("inf"), update)
+    return _loads.do(name, lambda: _load(name, loader, requested_at, update))
+
+
+def cached(name):
+    """Whether a snapshot (fresh or stale) is held for name"""
+    with _lock:
+        return name in _entries
+
+
+def seed(name, value, age=0.0):
+    """Cache value for name as if loaded age seconds ago (inf: already stale), unless one is cached"""
+    with _lock:
+        if name not in _entries:
+            _entries[name] = (time.monotonic() - age, value)
+
+
+def is_fresh(name):
+    """Whether a snapshot for name is cached and younger than its TTL"""
+    with _lock:
+        entry = _entries.get(name)
+    return entry is not None and time.monotonic() - entry[0] < get_ttl(name)
+
+
+def fetched_at(name):
+    """Monotonic time the cached snapshot for name was loaded, or None"""
+    with _lock:
+        entry = _entries.get(name)
+    return entry[0] if entry else None
+
+
+def last_change(name):
+    """Latest of when name was loaded, patched, expired or invalidated in this process (-inf if never)"""
+    with _lock:
+        entry = _entries.get(name)
+        return max(entry[0] if entry else float("-inf"), _changed.get(name, float("-inf")), _all_changed)
+
+
+def offer(name, value, loaded_at):
+    """Cache value, loaded elsewhere at monotonic time loaded_at, unless name was loaded or changed since"""
+    with _lock:
+        if loaded_at <= last_change(name):
+            return False
+        _entries[name] = (loaded_at, value)
+        return True
+
+
+def patch(name, updater):
+    """Apply updater(value) to a cached snapshot in place, if one is cached"""
+    with _lock:
+        _generations[name] += 1
+        _changed[name] = time.monotonic()
+        entry = _entries.get(name)
+        if entry:
+            updater(entry[1])
+
+
+def expire(*names):
+    """Mark the given snapshots stale but keep them, so the next read can update them incrementally"""
+    with _lock:
+        for name in names:
+            _generations[name] += 1
+            _changed[name] = time.monotonic()
+            entry = _entries.get(name)
+            if entry:
+                _entries[name] = (float("-inf"), entry[1])
+
+
+def invalidate(*names):
+    """Drop the given snapshots (all of them when no name is given)"""
+    global _epoch, _all_changed
+    with _lock:
+        if not names:
+            _epoch += 1
+            _all_changed = time.monotonic()
+            _entries.clear()
+        for name in names:
+            _generations[name] += 1
+            _changed[name] = time.monotonic()
+            _entries.pop(name, None)
@@ -0,0 +1,16 @@
+import os
+
+import streamlit as st
+
+
+def get_setting(section, key, default=None):
+    """Read [section] key from Streamlit secrets, overridable by FARAJA_<SECTION>_<KEY>"""
+    env_name = f"FARAJA_{section}_{key}".upper()
+    if env_name in os.environ:
+        return os.environ[env_name]
+
+    try:
+        return st.secrets[section][key]
+    except (KeyError, FileNotFoundError):
+        # ✅ No secrets file or no such entry: fall back to the default
+        return default
@@ -1,8 +1,48 @@
-def filter_sessions(df, therapy_name, therapist_name, date):
-    if therapy_name != "All":
-        df = df[df["Therapy Name"] == therapy_name]
-    if therapist_name != "All":
-        df = df[df["Therapist Name"] == therapist_name]
-    if date:
-        df = df[df["Date Available"] == date.strftime("%Y-%m-%d")]
-    return df
+import numpy as np
+
+# Categorical columns of a normalized Sessions frame offered as filters on the Book Session page
+SESSION_FACETS = ["Faraja Center Location", "Booking Status", "Therapy Name", "Online or Physical"]
+
+
+def facet_filter(df, selections, start_date=None, end_date=None, facets=SESSION_FACETS):
+    """Apply all facet selections ("All" = no filter) and the date range over category codes.
+
+    Returns the matching row ids and, per facet, {option: count} over rows matching the *other* filters.
+    """
+    codes = {column: df[column].cat.codes.to_numpy() for column in facets}
+
+    base = np.ones(len(df), dtype=bool)
+    dates = df["Date Available"].to_numpy()
+    if start_date is not None:
+        base &= dates >= np.datetime64(start_date)
+    if end_date is not None:
+        base &= dates <= np.datetime64(end_date)
+
+    masks = {}
+    for column in facets:
+        value = selections.get(column, "All")
+        if value != "All":
+            # Unknown values get code -1, which matches no row
+            code = df[column].cat.categories.get_indexer([value])[0]
+            masks[column] = codes[column] == code if code >= 0 else np.zeros(len(df), dtype=bool)
+
+    matched = base.copy()
+    for mask in masks.values():
+        matched &= mask
+
+    counts = {}
+    for column in facets:
+        others = base.copy()
+        for other, mask in masks.items():
+            if other != column:
+                others &= mask
+        column_codes = codes[column][others]
+        tally = np.bincount(column_codes[column_codes >= 0], minlength=len(df[column].cat.categories))
+        counts[column] = {option: int(n) for option, n in zip(df[column].cat.categories, tally) if n}
+
+    return df.index[matched], counts
+
+
+def facet_options(counts, selected="All"):
+    """Selectbox options for one facet: "All", every option with matches, and the current pick"""
+    return ["All"] + sorted(set(counts) | ({selected} - {"All"}))
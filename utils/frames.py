@@ -0,0 +1,70 @@
+import pandas as pd
+
+from utils.indexes import normalize_phone
+
+SESSION_CATEGORIES = ["Faraja Center Location", "Therapy Name", "Therapist Name", "Online or Physical"]
+BOOKING_STATUSES = ["Available", "Full"]
+TIME_FORMAT = "%I:%M %p"
+
+
+def to_flag(value):
+    """Sheet checkbox/text ("TRUE", True, 1) as a bool"""
+    return str(value).strip().upper() in ("TRUE", "1")
+
+
+def _at_time(dates, times):
+    """Datetimes for "10:00 AM"-style times on the given dates (NaT when unparseable)"""
+    parsed = pd.to_datetime(times.astype(str).str.strip(), format=TIME_FORMAT, errors="coerce")
+    return dates + (parsed - parsed.dt.normalize())
+
+
+def booking_times(dates, times):
+    """Start and end datetimes of bookings from their Date and "10:00 AM - 11:00 AM" Time columns"""
+    parts = times.astype(str).str.extract(r"^(.*?) - (.*)$")
+    return _at_time(dates, parts[0]), _at_time(dates, parts[1])
+
+
+def normalize_sessions(df):
+    """Typed copy of a Sessions frame: datetime dates, parsed start/end, int counts, categorical labels"""
+    if df.columns.empty:  # nothing read at all; a header-only tab still gets typed (empty) columns
+        return df
+    df = df.copy()
+
+    df["Date Available"] = pd.to_datetime(df["Date Available"].astype(str).str.strip(), errors="coerce")
+    df["Starts At"] = _at_time(df["Date Available"], df["Start Time"])
+    df["Ends At"] = _at_time(df["Date Available"], df["End Time"])
+
+    for column in ("Maximum Attendees", "Current Attendees"):
+        df[column] = pd.to_numeric(df[column], errors="coerce").fillna(0).astype(int)
+
+    for column in SESSION_CATEGORIES:
+        df[column] = df[column].astype("category")
+    # ✅ Both statuses are always valid categories so in-place status patches never fail
+    statuses = sorted(set(df["Booking Status"].dropna().astype(str)) | set(BOOKING_STATUSES))
+    df["Booking Status"] = pd.Categorical(df["Booking Status"].astype(str), categories=statuses)
+
+    return df
+
+
+def normalize_bookings(df):
+    """Typed copy of a Bookings frame: zero-padded phones, datetime dates, bool flags"""
+    if df.columns.empty:
+        return df
+    df = df.copy()
+
+    df["Phone"] = df["Phone"].astype(str).str.strip().str.zfill(10)
+    df["Date"] = pd.to_datetime(df["Date"].astype(str).str.strip(), format="%Y-%m-%d", errors="coerce")
+    for flag in ("is_cancelled", "is_rescheduled"):
+        df[flag] = df[flag].map(to_flag).astype(bool)
+
+    return df
+
+
+def normalize_booking_record(record):
+    """One Bookings row (dict) in the same types normalize_bookings produces"""
+    record = dict(record)
+    record["Phone"] = normalize_phone(record["Phone"])
+    record["Date"] = pd.to_datetime(record["Date"])
+    for flag in ("is_cancelled", "is_rescheduled"):
+        record[flag] = to_flag(record[flag])
+    return record
@@ -1,44 +1,564 @@
+import logging
+import threading
+import time
+
 import gspread
+from google.auth.exceptions import GoogleAuthError, TransportError
+from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials
 import pandas as pd
+import requests
 import streamlit as st
 
-def connect_to_gsheet():
-    """Authenticate and connect to Google Sheets using Streamlit secrets"""
-    try:
-        # ✅ Load credentials from Streamlit Secrets
-        creds_dict = st.secrets["gcp_service_account"]
+from utils.cache import (
+    cached, expire, fetched_at, get_snapshot, get_ttl, invalidate, is_fresh, last_change, offer, patch, seed, set_ttl
+)
+from utils.config import get_setting
+from utils.frames import normalize_booking_record, normalize_bookings, normalize_sessions
+from utils.indexes import PhoneIndex, SessionIndex, normalize_phone
+from utils.instrumentation import instrument
+from utils.intervals import BookingIntervals
+from utils.refresher import STALE_INTERVALS, get_refresher, request_refresh, start_refresher
+from utils.shared_state import get_shared_state
+from utils.snapshot_store import get_snapshot_store
+from utils.storage import BOOKING_FIELDS, SESSION_FIELDS
+
+logger = logging.getLogger("faraja.gsheet")
+
+SCOPES = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive"
+]
+
+# Snapshot cache keys, one per worksheet
+SESSIONS = "Sessions"
+BOOKINGS = "Bookings"
+ARCHIVE = "Bookings Archive"  # past bookings moved out of Bookings by utils.archive
+
+# Column letters of the cells the app writes, by header name
+SESSION_COLUMNS = {"Current Attendees": "I", "Booking Status": "J"}
+BOOKING_COLUMNS = {"is_cancelled": "L", "is_rescheduled": "M", "reason": "N"}
+
+# Columns compared to tell whether a Bookings row is still on the sheet row the snapshot has it on
+ROW_IDENTITY = ["Timestamp", "Name", "Time"]
+
+# Longest a Bookings snapshot is kept up to date by delta syncs alone before a full re-download
+DEFAULT_FULL_SYNC_SECONDS = 600
+# Fewest seconds between two saves of one snapshot to disk
+DEFAULT_SAVE_INTERVAL_SECONDS = 60
+
+# Errors after which the pooled client/spreadsheet handle can no longer be trusted
+RECONNECT_ERRORS = (GoogleAuthError, TransportError, requests.exceptions.ConnectionError)
+
+# ✅ Process-wide connection state (module globals survive Streamlit reruns)
+_lock = threading.RLock()
+_credentials = None
+_client = None
+_spreadsheet = None
+_worksheets = {}
+_headers = {}  # worksheet title -> header row, resolved once and checked on every projected read
+_phone_index = None  # PhoneIndex of the cached Bookings frame
+_session_index = None  # SessionIndex of the cached Sessions frame
+_booking_intervals = None  # BookingIntervals of the cached Bookings frame
+_bookings_full_sync_at = float("-inf")  # when Bookings was last downloaded in full
+_warm_started = set()  # snapshot names already looked up on disk by this process
+_saved = {}  # snapshot name -> (frame, monotonic time) last written to disk
+_published = {}  # snapshot name -> frame last published to (or adopted from) the shared state
+
+
+def _open_spreadsheet():
+    """Authorize a fresh client and open the configured spreadsheet"""
+    global _credentials, _client, _spreadsheet
+
+    # ✅ Load credentials from Streamlit Secrets
+    creds_dict = st.secrets["gcp_service_account"]
+    _credentials = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
+    _client = gspread.authorize(_credentials)
+
+    # ✅ Load Google Sheet ID from Streamlit secrets
+    sheet_id = st.secrets["google_sheets"]["sheet_id"]
+    _spreadsheet = instrument(_client.open_by_key(sheet_id))  # ✅ every call through it is counted and timed
+    _worksheets.clear()
+    _headers.clear()
+    _warm_started.clear()
+
+
+def reset_connection():
+    """Drop the pooled client so the next call re-authenticates from scratch"""
+    global _credentials, _client, _spreadsheet
+    with _lock:
+        _credentials = None
+        _client = None
+        _spreadsheet = None
+        _worksheets.clear()
+        _headers.clear()
+        _warm_started.clear()
+
+
+def set_connection(client, spreadsheet):
+    """Use an already opened spreadsheet (e.g. the offline fake in benchmarks/) as the pooled handle"""
+    global _credentials, _client, _spreadsheet
+    with _lock:
+        _credentials = None
+        _client = client
+        _spreadsheet = instrument(spreadsheet)
+        _worksheets.clear()
+        _headers.clear()
+        _warm_started.clear()
+
+
+def get_connection():
+    """Return the shared (client, spreadsheet), building or refreshing it only when needed"""
+    with _lock:
+        if _spreadsheet is None:
+            _open_spreadsheet()
+        elif _credentials is not None and not _credentials.valid:
+            # ✅ Token expired: refresh in place instead of rebuilding the client
+            try:
+                _credentials.refresh(Request())
+            except RECONNECT_ERRORS:
+                reset_connection()
+                _open_spreadsheet()
+        return _client, _spreadsheet
+
+
+def get_worksheet(title=None):
+    """Return a cached worksheet handle; None means the first sheet ("Sessions")"""
+    _, spreadsheet = get_connection()
+    with _lock:
+        if title not in _worksheets:
+            _worksheets[title] = spreadsheet.sheet1 if title is None else spreadsheet.worksheet(title)
+        return _worksheets[title]
+
 
-        # ✅ Authenticate with Google Sheets API
-        creds = Credentials.from_service_account_info(creds_dict, scopes=[
-            "https://spreadsheets.google.com/feeds",
-            "https://www.googleapis.com/auth/drive"
-        ])
+def cell(columns, name, row):
+    """A1 reference of column name (from SESSION_COLUMNS/BOOKING_COLUMNS) on a sheet row"""
+    return f"{columns[name]}{row}"
 
-        client = gspread.authorize(creds)
 
-        # ✅ Load Google Sheet ID from Streamlit secrets
-        sheet_id = st.secrets["google_sheets"]["sheet_id"]
-        spreadsheet = client.open_by_key(sheet_id)
-        sheet = spreadsheet.sheet1  # First sheet (assumed to be "Sessions")
+def forget_worksheet(title):
+    """Drop a cached worksheet handle, e.g. after the tab was created or deleted"""
+    with _lock:
+        _worksheets.pop(title, None)
+
+
+def _column_letter(position):
+    """A1 column letter of a 0-based column position"""
+    return gspread.utils.rowcol_to_a1(1, position + 1)[:-1]
+
+
+def _column_runs(header, columns):
+    """[first, last] 0-based positions of the wanted columns present in header, adjacent ones merged"""
+    runs = []
+    for position in sorted({header.index(column) for column in columns if column in header}):
+        if runs and runs[-1][1] == position - 1:
+            runs[-1][1] = position
+        else:
+            runs.append([position, position])
+    return runs
+
+
+def get_header(title):
+    """Header row of a worksheet, read once and reused by every projected read"""
+    with _lock:
+        header = _headers.get(title)
+    if header is None:
+        response = with_reconnect(lambda spreadsheet: spreadsheet.values_batch_get([f"'{title}'!1:1"]))
+        header = (response["valueRanges"][0].get("values") or [[]])[0]
+        with _lock:
+            _headers[title] = header
+    return header
+
+
+def read_columns(title, spans):
+    """Raw string values of named columns, one DataFrame per (columns, first_row, last_row or None) span.
+
+    All spans go out as one values_batch_get with a range per run of adjacent columns, read column-major so
+    each column arrives as one array. The cached header mapping is re-checked in the same call. Frames are
+    labelled like get_all_records rows (sheet row - 2); columns the sheet lacks come back as "".
+    """
+    for attempt in range(2):
+        header = get_header(title)
+        ranges = [f"'{title}'!1:1"]
+        layout = []  # per span: [(range position, first column position, last column position)]
+        for columns, first_row, last_row in spans:
+            runs = []
+            for first, last in _column_runs(header, columns):
+                runs.append((len(ranges), first, last))
+                ranges.append(
+                    f"'{title}'!{_column_letter(first)}{first_row}:{_column_letter(last)}{last_row or ''}"
+                )
+            layout.append(runs)
+
+        response = with_reconnect(
+            lambda spreadsheet: spreadsheet.values_batch_get(ranges, params={"majorDimension": "COLUMNS"})
+        )
+        value_ranges = [value_range.get("values", []) for value_range in response["valueRanges"]]
+        current = [column[0] if column else "" for column in value_ranges[0]]
+        if current == header:
+            break
+        # ✅ Columns were moved or added since the mapping was resolved: adopt the new header and read again
+        with _lock:
+            _headers[title] = current
+    else:
+        raise RuntimeError(f"The header of {title} changed while it was being read")
+
+    frames = []
+    for (columns, first_row, _), runs in zip(spans, layout):
+        data = {}
+        for position, first, last in runs:
+            values = value_ranges[position]
+            for offset in range(last - first + 1):
+                data[header[first + offset]] = values[offset] if offset < len(values) else []
+        # ✅ The API leaves out trailing empty cells, so columns are padded to the longest one
+        rows = max(map(len, data.values()), default=0)
+        frames.append(pd.DataFrame(
+            {column: data.get(column, []) + [""] * (rows - len(data.get(column, []))) for column in columns},
+            index=pd.RangeIndex(first_row - 2, first_row - 2 + rows)
+        ))
+    return frames
+
+
+def with_reconnect(operation):
+    """Run operation(spreadsheet), rebuilding the connection once on auth/transport errors"""
+    _, spreadsheet = get_connection()
+    try:
+        return operation(spreadsheet)
+    except RECONNECT_ERRORS:
+        reset_connection()
+        _, spreadsheet = get_connection()
+        return operation(spreadsheet)
+
+
+def connect_to_gsheet():
+    """Return the pooled Google Sheets connection, authenticating only on first use"""
+    try:
+        try:
+            client, spreadsheet = get_connection()
+            sheet = get_worksheet()  # First sheet (assumed to be "Sessions")
+        except RECONNECT_ERRORS:
+            # ✅ Stale handle: rebuild once before giving up
+            reset_connection()
+            client, spreadsheet = get_connection()
+            sheet = get_worksheet()
 
         return client, spreadsheet, sheet
 
     except Exception as e:
+        reset_connection()
         st.error(f"❌ Failed to connect to Google Sheets: {e}")
         return None, None, None  # Ensure function returns valid values on failure
 
-def get_sessions(sheet):
-    """Fetch therapy sessions from Google Sheets and return as a DataFrame"""
+
+def _warm_start(name):
+    """Seed the cache once per process with the frame an earlier process saved to disk.
+
+    The frame keeps its age on disk, so the usual TTL decides whether it is served as is or brought
+    up to date first (Bookings by delta sync); a running refresher revalidates it in the background.
+    """
+    global _bookings_full_sync_at
+    with _lock:
+        if name in _warm_started:
+            return
+        _warm_started.add(name)
+    store = get_snapshot_store()
+    if store is None or cached(name):
+        return
+
+    _, spreadsheet = get_connection()
+    saved = store.load(name, spreadsheet.id)
+    if saved is None:
+        return
+    df, marker = saved
+    if name == BOOKINGS:
+        # ✅ Carry the age of the last full download over, so delta syncs stop when it would have
+        _bookings_full_sync_at = time.monotonic() - (time.time() - marker.get("full_sync_at", float("-inf")))
+    with _lock:
+        _saved[name] = (df, time.monotonic())  # ✅ already on disk: no need to write it straight back
+    seed(name, df, age=max(0.0, time.time() - marker["saved_at"]))
+    if get_refresher() is not None:
+        request_refresh(name)
+
+
+def _save(name, df, **extra):
+    """Write a newly loaded snapshot to disk for the next process, at most every [snapshot] save_interval_seconds"""
+    store = get_snapshot_store()
+    if store is None or df.empty:
+        return
+    interval = float(get_setting("snapshot", "save_interval_seconds", DEFAULT_SAVE_INTERVAL_SECONDS))
+    now = time.monotonic()
+    with _lock:
+        frame, saved_at = _saved.get(name, (None, float("-inf")))
+        if frame is df or now - saved_at < interval:
+            return
+        _saved[name] = (df, now)
+    try:
+        store.save(name, df, get_connection()[1].id, **extra)
+    except Exception:
+        logger.exception(f"Could not save the {name} snapshot to disk")
+
+
+def _wall_clock(monotonic):
+    return time.time() - (time.monotonic() - monotonic)
+
+
+def _adopt_shared(name, max_age):
+    """Cache the copy of name another replica published, if loaded within max_age seconds and after any
+    load or change of it in this process; returns whether one was adopted"""
+    global _bookings_full_sync_at
+    shared = get_shared_state()
+    if shared is None:
+        return False
+    loaded_after = max(last_change(name), time.monotonic() - max_age)
+    try:
+        saved = shared.load_snapshot(name, get_connection()[1].id, _wall_clock(loaded_after))
+    except Exception:
+        logger.exception(f"Could not read the shared {name} snapshot")
+        return False
+    if saved is None:
+        return False
+    df, marker = saved
+    if not offer(name, df, time.monotonic() - (time.time() - marker["loaded_at"])):
+        return False
+    with _lock:
+        _published[name] = df
+    if name == BOOKINGS:
+        _bookings_full_sync_at = time.monotonic() - (time.time() - marker["full_sync_at"])
+    return True
+
+
+def _publish(name, df, **extra):
+    """Share a snapshot this process just loaded with the other replicas"""
+    shared = get_shared_state()
+    loaded_at = fetched_at(name)
+    if shared is None or loaded_at is None:
+        return
+    with _lock:
+        if _published.get(name) is df:
+            return
+        _published[name] = df
+    try:
+        shared.save_snapshot(name, df, get_connection()[1].id, _wall_clock(loaded_at), **extra)
+    except Exception:
+        logger.exception(f"Could not publish the {name} snapshot")
+
+
+def _sessions_snapshot(sheet, refresh=False):
+    """Shared, normalized Sessions frame (never mutate it directly) and its session-key index"""
+    global _session_index
+    _warm_start(SESSIONS)
+    if not refresh and not is_fresh(SESSIONS):
+        # ✅ A copy another replica loaded within the TTL is as good as downloading one
+        _adopt_shared(SESSIONS, get_ttl(SESSIONS))
+    df = get_snapshot(
+        SESSIONS, lambda: normalize_sessions(read_columns(sheet.title, [(SESSION_FIELDS, 2, None)])[0]),
+        refresh=refresh
+    )
+    with _lock:
+        loaded = _session_index is None or _session_index.frame is not df
+        if loaded:
+            _session_index = SessionIndex(df)
+        session_index = _session_index
+    if loaded:
+        _save(SESSIONS, df)
+        _publish(SESSIONS, df)
+    return df, session_index
+
+
+def get_session_index(sheet=None):
+    """SessionIndex of the cached Sessions snapshot, loading it if needed"""
+    return _sessions_snapshot(sheet or get_worksheet())[1]
+
+
+def get_sessions(sheet, refresh=False):
+    """Fetch therapy sessions (cached per TTL) and return as a DataFrame"""
     try:
         # ✅ Ensure the sheet object is valid before fetching data
         if not sheet:
             raise ValueError("Google Sheet connection is not established.")
 
-        # ✅ Fetch all records and convert to DataFrame
-        data = sheet.get_all_records()
-        return pd.DataFrame(data)
+        # ✅ Serve from the shared snapshot; callers get their own copy to mutate
+        df, _ = _sessions_snapshot(sheet, refresh=refresh)
+        return df.copy()
 
     except Exception as e:
         st.error(f"❌ Error fetching session data: {e}")
         return pd.DataFrame()  # Return an empty DataFrame on failure
+
+
+def _load_bookings():
+    """Download and normalize the BOOKING_FIELDS columns of the whole Bookings tab"""
+    global _bookings_full_sync_at
+    started = time.monotonic()
+    df = normalize_bookings(read_columns(BOOKINGS, [(BOOKING_FIELDS, 2, None)])[0])
+    _bookings_full_sync_at = started
+    return df
+
+
+def _incremental_bookings():
+    """Whether stale Bookings snapshots are delta-synced, per [cache] incremental_bookings (default on)"""
+    return str(get_setting("cache", "incremental_bookings", True)).strip().lower() not in ("0", "false", "no", "off")
+
+
+def _same_row(raw, previous):
+    """Whether raw (ROW_IDENTITY of one sheet row) still matches the snapshot's last row"""
+    return len(raw) == 1 and raw.iloc[0].tolist() == previous[ROW_IDENTITY].iloc[-1].astype(str).tolist()
+
+
+def _sync_bookings(previous):
+    """previous plus the rows appended since and any changed flag cells, or None when a full reload is needed.
+
+    One values_batch_get reads the flag columns of the known rows, the identity of the last one (to catch
+    deleted rows) and the BOOKING_FIELDS of everything below them, so the cost grows with new activity
+    rather than with the whole history.
+    """
+    global _phone_index
+    full_sync_seconds = float(get_setting("cache", "bookings_full_sync_seconds", DEFAULT_FULL_SYNC_SECONDS))
+    if previous.empty or time.monotonic() - _bookings_full_sync_at > full_sync_seconds:
+        return None
+
+    rows = len(previous)
+    flag_names = list(BOOKING_COLUMNS)
+    flags, last, appended = read_columns(BOOKINGS, [
+        (flag_names, 2, rows + 1), (ROW_IDENTITY, rows + 1, rows + 1), (BOOKING_FIELDS, rows + 2, None)
+    ])
+    if len(flags) != rows or list(previous.columns) != BOOKING_FIELDS or not _same_row(last, previous):
+        # ✅ Rows were deleted/archived (or the snapshot has another shape): only a full download is safe
+        return None
+    flags.index = previous.index
+
+    # ✅ Compare the raw strings column-wise against the snapshot
+    changed = pd.Series(False, index=previous.index)
+    for flag in flag_names:
+        if flag in ("is_cancelled", "is_rescheduled"):
+            flags[flag] = flags[flag].str.strip().str.upper().isin(("TRUE", "1"))
+            changed |= flags[flag] != previous[flag]
+        else:
+            changed |= flags[flag] != previous[flag].astype(str)
+    flags = flags.loc[changed]
+
+    if not changed.any() and appended.empty:
+        return previous
+
+    df = previous.copy()
+    if changed.any():
+        df.loc[flags.index, flag_names] = flags[flag_names]
+    if not appended.empty:
+        appended = normalize_bookings(appended)
+        df = pd.concat([df, appended])
+
+    with _lock:
+        # ✅ Carry the phone index over instead of re-normalizing every phone
+        if _phone_index is not None and _phone_index.frame is previous:
+            _phone_index = _phone_index.extended(df, appended.index, appended["Phone"] if not appended.empty else ())
+    return df
+
+
+def _bookings_snapshot(refresh=False):
+    """Shared, normalized Bookings frame (never mutate it directly) and its phone index"""
+    global _phone_index, _booking_intervals
+    _warm_start(BOOKINGS)
+    if not refresh and not is_fresh(BOOKINGS):
+        _adopt_shared(BOOKINGS, get_ttl(BOOKINGS))
+    df = get_snapshot(
+        BOOKINGS, _load_bookings, refresh=refresh, update=_sync_bookings if _incremental_bookings() else None
+    )
+    with _lock:
+        # ✅ Rebuild only when a new snapshot was loaded; patches and delta syncs keep it current otherwise
+        loaded = _phone_index is None or _phone_index.frame is not df
+        if loaded:
+            _phone_index = PhoneIndex(df)
+        phone_index = _phone_index
+        if _booking_intervals is None or _booking_intervals.frame is not df:
+            _booking_intervals = BookingIntervals(df, phone_index)  # ✅ cheap: each phone is built on first lookup
+    if loaded:
+        # Wall-clock time of the last full download, so the next process knows when one is due
+        full_sync_at = _wall_clock(_bookings_full_sync_at)
+        _save(BOOKINGS, df, full_sync_at=full_sync_at)
+        _publish(BOOKINGS, df, full_sync_at=full_sync_at)
+    return df, phone_index
+
+
+def get_bookings(phone=None, refresh=False):
+    """Fetch bookings (cached per TTL), optionally only those for phone, as a DataFrame"""
+    df, phone_index = _bookings_snapshot(refresh)
+    if phone is None:
+        return df.copy()
+    return df.loc[phone_index.labels(phone)].copy()
+
+
+def find_overlapping_bookings(phone, starts_at, ends_at, refresh=False):
+    """Active bookings of phone whose session overlaps [starts_at, ends_at), via the per-phone interval index"""
+    _bookings_snapshot(refresh)
+    with _lock:
+        intervals = _booking_intervals
+    return intervals.frame.loc[intervals.overlapping(phone, starts_at, ends_at)].copy()
+
+
+def add_cached_booking(append_response, record):
+    """Add a row just written by append_row to the cached Bookings frame and phone index"""
+    updated_range = append_response["updates"]["updatedRange"]
+    row = gspread.utils.a1_to_rowcol(updated_range.split("!")[-1].split(":")[0])[0]
+    record = normalize_booking_record(record)
+
+    def apply(df):
+        label = row - 2
+        if label != len(df) or df.columns.empty:
+            # ✅ Someone else appended meanwhile (or the tab was empty): let the next read sync it
+            expire(BOOKINGS)
+            return
+        df.loc[label] = [record.get(column, "") for column in df.columns]
+        with _lock:
+            if _phone_index is not None and _phone_index.frame is df:
+                _phone_index.add(label, record["Phone"])
+            if _booking_intervals is not None and _booking_intervals.frame is df:
+                _booking_intervals.update(label)
+    patch(BOOKINGS, apply)
+
+
+def set_cached_booking_fields(row, values):
+    """Mirror cell writes on Bookings sheet row into the cached frame"""
+    def apply(df):
+        try:
+            for column, value in values.items():
+                df.at[row - 2, column] = value
+        except (KeyError, TypeError, ValueError):
+            invalidate(BOOKINGS)
+            return
+        with _lock:
+            if _booking_intervals is not None and _booking_intervals.frame is df:
+                _booking_intervals.update(row - 2)
+    patch(BOOKINGS, apply)
+
+
+def _load_archive():
+    try:
+        get_worksheet(ARCHIVE)
+    except gspread.WorksheetNotFound:
+        return pd.DataFrame(columns=BOOKING_FIELDS)
+    return normalize_bookings(read_columns(ARCHIVE, [(BOOKING_FIELDS, 2, None)])[0])
+
+
+def get_archived_bookings(phone=None):
+    """Bookings moved to the archive tab, optionally only those for phone; only read when asked for"""
+    df = get_snapshot(ARCHIVE, _load_archive)
+    if phone is None or df.empty:
+        return df.copy()
+    return df[df["Phone"] == normalize_phone(phone)].copy()
+
+
+def start_background_refresh():
+    """Keep Sessions and Bookings warm from a background thread so page renders read only from memory"""
+    def refresh(name, snapshot):
+        # ✅ A copy another replica loaded within the last interval saves this one its own download
+        return lambda: snapshot(refresh=not _adopt_shared(name, get_refresher().interval))
+
+    refresher = start_refresher({
+        SESSIONS: refresh(SESSIONS, lambda refresh: _sessions_snapshot(get_worksheet(), refresh=refresh)),
+        BOOKINGS: refresh(BOOKINGS, _bookings_snapshot),
+    })
+    if refresher is not None:
+        # ✅ Serve the last snapshot between refreshes; fetch inline only if the refresher falls far behind
+        for name in refresher.refreshers:
+            set_ttl(name, refresher.interval * STALE_INTERVALS)
+    return refresher
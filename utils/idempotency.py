@@ -0,0 +1,190 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing, contextmanager
+
+import streamlit as st
+
+from utils.config import get_setting
+from utils.indexes import SessionKey
+
+DEFAULT_RETENTION_DAYS = 7
+DEFAULT_SEAT_HOLD_SECONDS = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    steps TEXT NOT NULL DEFAULT '',
+    result TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS seat_holds (
+    token TEXT PRIMARY KEY,
+    session TEXT NOT NULL,
+    taken_at REAL NOT NULL
+);
+"""
+
+
+class IdempotencyStore:
+    """SQLite record of booking operations by request key: the steps already done and the final result.
+
+    It also keeps the seat holds: seats written to Sessions whose Bookings row is not written yet, which
+    utils.reconcile must not hand back.
+    """
+
+    def __init__(self, path, retention_days=DEFAULT_RETENTION_DAYS, seat_hold_seconds=DEFAULT_SEAT_HOLD_SECONDS):
+        self.path = path
+        self.retention_seconds = retention_days * 86400
+        self.seat_hold_seconds = seat_hold_seconds
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        self.purge()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, key, kind):
+        """(steps, result) recorded for key, creating the record on first use"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO operations (key, kind, updated_at) VALUES (?, ?, ?)", (key, kind, time.time())
+            )
+            stored_kind, steps, result = conn.execute(
+                "SELECT kind, steps, result FROM operations WHERE key = ?", (key,)
+            ).fetchone()
+        if stored_kind != kind:
+            raise ValueError(f"Request key {key} was already used for a {stored_kind} operation")
+        return set(filter(None, steps.split(","))), result
+
+    def save(self, key, steps, result=None):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE operations SET steps = ?, result = ?, updated_at = ? WHERE key = ?",
+                (",".join(sorted(steps)), result, time.time(), key)
+            )
+
+    def purge(self):
+        """Forget operations untouched for longer than the retention period, and lapsed seat holds"""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM operations WHERE updated_at < ?", (now - self.retention_seconds,))
+            conn.execute("DELETE FROM seat_holds WHERE taken_at < ?", (now - self.seat_hold_seconds,))
+
+    def hold_seats(self, holds):
+        """Record {token: SessionKey} seats about to be written whose Bookings rows are not written yet"""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO seat_holds (token, session, taken_at) VALUES (?, ?, ?)",
+                [(token, json.dumps(list(key)), now) for token, key in holds.items()]
+            )
+
+    def release_seats(self, *tokens):
+        """Drop the holds of tokens, once their rows are written or their seats may be counted again"""
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("DELETE FROM seat_holds WHERE token = ?", [(token,) for token in tokens])
+
+    def holds_seat(self, token):
+        """Whether token still holds its seat; a lapsed hold may have been handed back by reconcile"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT 1 FROM seat_holds WHERE token = ? AND taken_at >= ?",
+                (token, time.time() - self.seat_hold_seconds)
+            ).fetchone()
+        return row is not None
+
+    def held_sessions(self):
+        """SessionKeys with a seat held, whose counts run ahead of Bookings on purpose"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT session FROM seat_holds WHERE taken_at >= ?", (time.time() - self.seat_hold_seconds,)
+            ).fetchall()
+        return {SessionKey(*json.loads(session)) for session, in rows}
+
+
+class Operation:
+    """Progress of one keyed operation; without a store (no key given) nothing is persisted"""
+
+    def __init__(self, store=None, key=None, steps=(), result=None):
+        self.store = store
+        self.key = key
+        self.steps = set(steps)
+        self.result = result
+
+    @property
+    def done(self):
+        return self.result is not None
+
+    def has(self, step):
+        return step in self.steps
+
+    def step(self, step):
+        """Record that step completed, so a retry skips it"""
+        self.steps.add(step)
+        if self.store is not None:
+            self.store.save(self.key, self.steps)
+
+    def finish(self, result):
+        """Record the final result that retries with the same key get back; returns it"""
+        self.result = result
+        if self.store is not None:
+            self.store.save(self.key, self.steps, result)
+        return result
+
+
+_lock = threading.Lock()
+_store = None
+# ✅ Striped locks: one key always maps to the same lock, and memory stays bounded
+_key_locks = [threading.Lock() for _ in range(64)]
+
+
+def get_idempotency_store():
+    """Process-wide store at [idempotency] path, keeping keys for [idempotency] retention_days and seat
+    holds for [idempotency] seat_hold_seconds"""
+    global _store
+    with _lock:
+        if _store is None:
+            _store = IdempotencyStore(
+                get_setting("idempotency", "path", "faraja_requests.db"),
+                float(get_setting("idempotency", "retention_days", DEFAULT_RETENTION_DAYS)),
+                float(get_setting("idempotency", "seat_hold_seconds", DEFAULT_SEAT_HOLD_SECONDS))
+            )
+        return _store
+
+
+@contextmanager
+def operation(key, kind):
+    """Yield the Operation for request key; concurrent uses of one key run one at a time.
+
+    Callers return op.result when op.done, skip steps already recorded, and call op.finish() with
+    the final result. Results that should be retried (e.g. "Error") are simply not finished.
+    """
+    if key is None:
+        yield Operation()
+        return
+
+    with _key_locks[hash(key) % len(_key_locks)]:
+        store = get_idempotency_store()
+        steps, result = store.load(key, kind)
+        yield Operation(store, key, steps, result)
+
+
+def request_key(action, *parts):
+    """Key for this browser session's current submission of action on parts, stable across reruns and
+    retries until finish_request(key) starts a new submission"""
+    digest = hashlib.sha256(repr((action,) + tuple(str(part) for part in parts)).encode()).hexdigest()[:16]
+    # ✅ One nonce per form: a later, deliberate repeat (book, cancel, book again) gets a fresh key
+    nonce = st.session_state.setdefault("_request_nonces", {}).setdefault(digest, uuid.uuid4().hex)
+    return f"{nonce}:{action}:{digest}"
+
+
+def finish_request(key):
+    """Retire key once its result is final, so submitting the same form again is a new operation"""
+    digest = key.rsplit(":", 1)[-1]
+    st.session_state.get("_request_nonces", {}).pop(digest, None)
@@ -0,0 +1,104 @@
+from collections import defaultdict
+from typing import NamedTuple
+
+import pandas as pd
+
+
+def normalize_phone(phone):
+    """Canonical 10-digit form of a phone number as stored in (or read back from) the sheet"""
+    return str(phone).strip().zfill(10)
+
+
+class PhoneIndex:
+    """Normalized phone -> Bookings frame labels (sheet row = label + 2), built once per snapshot"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._labels = defaultdict(list)
+        if "Phone" in frame.columns:
+            for label, phone in zip(frame.index, frame["Phone"]):
+                self._labels[normalize_phone(phone)].append(label)
+
+    def add(self, label, phone):
+        self._labels[normalize_phone(phone)].append(label)
+
+    def extended(self, frame, labels=(), phones=()):
+        """Index of frame, which keeps every row of self.frame under the same label, plus labels/phones"""
+        index = PhoneIndex(frame.iloc[:0])
+        index.frame = frame
+        index._labels.update((phone, list(phone_labels)) for phone, phone_labels in self._labels.items())
+        for label, phone in zip(labels, phones):
+            index.add(label, phone)
+        return index
+
+    def labels(self, phone):
+        return list(self._labels.get(normalize_phone(phone), ()))
+
+    def rows(self, phone):
+        """Sheet row numbers of the bookings made with phone"""
+        return [label + 2 for label in self.labels(phone)]
+
+    def __len__(self):
+        return len(self._labels)
+
+
+def normalize_date(value):
+    """ISO "YYYY-MM-DD" form of a date string, datetime or Timestamp"""
+    return pd.to_datetime(value).strftime("%Y-%m-%d")
+
+
+class SessionKey(NamedTuple):
+    """Identity of a therapy session, comparable across the Sessions and Bookings tabs"""
+    therapy_name: str
+    therapist_name: str
+    date: str
+    start_time: str
+    end_time: str
+
+    @classmethod
+    def of(cls, therapy_name, therapist_name, date, start_time, end_time):
+        return cls(str(therapy_name), str(therapist_name), normalize_date(date), str(start_time), str(end_time))
+
+    @classmethod
+    def from_session(cls, session):
+        """Key of a Sessions row (Therapist Name, Date Available, Start/End Time)"""
+        return cls.of(
+            session["Therapy Name"], session["Therapist Name"], session["Date Available"],
+            session["Start Time"], session["End Time"]
+        )
+
+    @classmethod
+    def from_booking(cls, booking):
+        """Key of the session a Bookings row refers to (Therapist, Date, "start - end" Time)"""
+        start_time, end_time = booking["Time"].split(" - ")
+        return cls.of(booking["Therapy Name"], booking["Therapist"], booking["Date"], start_time, end_time)
+
+
+class SessionIndex:
+    """SessionKey -> Sessions frame label (sheet row = label + 2), built once per snapshot"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._labels = {}
+        if frame.empty:
+            return
+
+        # ✅ Normalize whole columns at once rather than row by row
+        dates = pd.to_datetime(frame["Date Available"], errors="coerce").dt.strftime("%Y-%m-%d")
+        columns = zip(
+            frame["Therapy Name"].astype(str), frame["Therapist Name"].astype(str), dates,
+            frame["Start Time"].astype(str), frame["End Time"].astype(str)
+        )
+        for label, fields in zip(frame.index, columns):
+            # First row wins, like the boolean masks this replaces
+            self._labels.setdefault(SessionKey(*fields), label)
+
+    def label(self, key):
+        return self._labels.get(key)
+
+    def row(self, key):
+        label = self.label(key)
+        return None if label is None else label + 2
+
+    def __len__(self):
+        return len(self._labels)
@@ -0,0 +1,256 @@
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from utils.config import get_setting
+from utils.scheduler import get_scheduler
+
+logger = logging.getLogger("faraja.sheets")
+
+# gspread methods timed by the wrappers below, by kind; anything else passes straight through
+READ_OPERATIONS = frozenset({
+    "get_all_records", "get_all_values", "get_values", "get", "batch_get", "acell", "cell", "row_values",
+    "col_values", "values_get", "values_batch_get", "worksheet", "worksheets", "sheet1", "fetch_sheet_metadata"
+})
+WRITE_OPERATIONS = frozenset({
+    "update", "update_acell", "update_cell", "batch_update", "append_row", "append_rows", "values_update",
+    "values_append", "values_batch_update", "add_worksheet", "batch_clear", "delete_rows"
+})
+# Writes that may apply twice if repeated after an ambiguous (5xx) failure (batch_update: row deletions)
+NON_IDEMPOTENT_OPERATIONS = frozenset({
+    "append_row", "append_rows", "values_append", "add_worksheet", "batch_update", "delete_rows"
+})
+
+
+def operation_kind(operation):
+    return "write" if operation in WRITE_OPERATIONS else "read"
+
+
+class CallStats:
+    """Count, total seconds and failures of Sheets API calls by (worksheet, operation)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: [0, 0.0, 0])
+
+    def record(self, worksheet, operation, seconds, failed=False):
+        with self._lock:
+            stats = self._stats[(worksheet or "spreadsheet", operation)]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] += int(failed)
+
+    def rows(self):
+        """One dict per (worksheet, operation), busiest first"""
+        with self._lock:
+            items = [(key, list(stats)) for key, stats in self._stats.items()]
+        return [
+            {
+                "worksheet": worksheet, "operation": operation, "kind": operation_kind(operation),
+                "calls": calls, "ms": round(seconds * 1000, 1), "errors": errors
+            }
+            for (worksheet, operation), (calls, seconds, errors) in sorted(items, key=lambda item: -item[1][0])
+        ]
+
+    def total_calls(self):
+        with self._lock:
+            return sum(stats[0] for stats in self._stats.values())
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class PageTrace:
+    """Phase timings (connect, fetch, filter, render, ...) and API calls of one page rerun"""
+
+    def __init__(self, page):
+        self.page = page
+        self.calls = CallStats()
+        self.phases = {}  # phase -> seconds, in first-seen order
+        self.total = None
+        self._started = time.perf_counter()
+        self._phase = None
+        self._phase_started = self._started
+
+    def mark(self, phase):
+        """End the current phase and start phase (None just ends it); repeated phases accumulate"""
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.phases[self._phase] = self.phases.get(self._phase, 0.0) + now - self._phase_started
+        self._phase, self._phase_started = phase, now
+
+    def finish(self):
+        self.mark(None)
+        self.total = time.perf_counter() - self._started
+
+    def as_record(self):
+        """Structured form logged once per rerun"""
+        rows = self.calls.rows()
+        return {
+            "event": "page_render",
+            "page": self.page,
+            "total_ms": round((self.total or 0.0) * 1000, 1),
+            "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()},
+            "api_calls": sum(row["calls"] for row in rows),
+            "api_ms": round(sum(row["ms"] for row in rows), 1),
+            "calls": rows,
+        }
+
+
+# ✅ Process-wide totals; the current rerun's trace is per context (Streamlit runs each script in its own
+# thread, and asyncio.to_thread workers inherit the caller's context)
+_totals = CallStats()
+_trace = ContextVar("page_trace", default=None)
+_logging_configured = False
+
+
+def get_totals():
+    """CallStats of every Sheets call made by this process"""
+    return _totals
+
+
+def current_trace():
+    return _trace.get()
+
+
+def start_trace(page):
+    """Begin tracing a page rerun in the current context"""
+    trace = PageTrace(page)
+    _trace.set(trace)
+    return trace
+
+
+def finish_trace(trace):
+    """Close trace, detach it from the current context and log its summary"""
+    trace.finish()
+    if current_trace() is trace:
+        _trace.set(None)
+    logger.info(json.dumps(trace.as_record()))
+
+
+def mark_phase(phase):
+    """Switch the current rerun to phase; a no-op outside a traced page"""
+    trace = current_trace()
+    if trace is not None:
+        trace.mark(phase)
+
+
+def configure_logging():
+    """Send faraja.* logs to stderr at the [logging] level (default INFO), once per process"""
+    global _logging_configured
+    if _logging_configured:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    root = logging.getLogger("faraja")
+    root.addHandler(handler)
+    root.setLevel(str(get_setting("logging", "level", "INFO")).upper())
+    root.propagate = False
+    _logging_configured = True
+
+
+def _record(worksheet, operation, seconds, failed):
+    _totals.record(worksheet, operation, seconds, failed)
+    trace = current_trace()
+    if trace is not None:
+        trace.calls.record(worksheet, operation, seconds, failed)
+    logger.debug(json.dumps({
+        "event": "sheets_call", "worksheet": worksheet or "spreadsheet", "operation": operation,
+        "kind": operation_kind(operation), "ms": round(seconds * 1000, 1), "failed": failed
+    }))
+
+
+def _frozen(value):
+    """value with its lists and dicts turned into tuples, so a read's ranges and params can key it"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _frozen(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_frozen(item) for item in value)
+    return value
+
+
+def _read_key(worksheet, operation, args, kwargs):
+    """Identity of a read for coalescing, or None when its arguments are unhashable"""
+    key = (worksheet, operation, _frozen(args), _frozen(kwargs))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _api_call(worksheet, operation, method):
+    """method wrapped to go through the quota scheduler, timing and recording every attempt"""
+    kind = operation_kind(operation)
+
+    def attempt(args, kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = method(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            _record(worksheet, operation, time.perf_counter() - started, failed)
+
+    @functools.wraps(method)
+    def call(*args, **kwargs):
+        return get_scheduler().run(
+            kind, lambda: attempt(args, kwargs),
+            key=_read_key(worksheet, operation, args, kwargs) if kind == "read" else None,
+            idempotent=operation not in NON_IDEMPOTENT_OPERATIONS
+        )
+    return call
+
+
+class InstrumentedWorksheet:
+    """Worksheet proxy that schedules, counts and times every read and write"""
+
+    def __init__(self, worksheet, spreadsheet):
+        self._worksheet = worksheet
+        self.spreadsheet = spreadsheet
+
+    def __getattr__(self, name):
+        value = getattr(self._worksheet, name)
+        if name in READ_OPERATIONS or name in WRITE_OPERATIONS:
+            return _api_call(self._worksheet.title, name, value)
+        return value
+
+
+class InstrumentedSpreadsheet:
+    """Spreadsheet proxy whose spreadsheet-level calls and worksheets are scheduled and instrumented"""
+
+    def __init__(self, spreadsheet):
+        self._spreadsheet = spreadsheet
+
+    def _wrap(self, worksheet):
+        return InstrumentedWorksheet(worksheet, self)
+
+    @property
+    def sheet1(self):
+        return self._wrap(_api_call(None, "sheet1", lambda: self._spreadsheet.sheet1)())
+
+    def worksheet(self, title):
+        return self._wrap(_api_call(None, "worksheet", self._spreadsheet.worksheet)(title))
+
+    def add_worksheet(self, *args, **kwargs):
+        return self._wrap(_api_call(None, "add_worksheet", self._spreadsheet.add_worksheet)(*args, **kwargs))
+
+    def __getattr__(self, name):
+        value = getattr(self._spreadsheet, name)
+        if name in READ_OPERATIONS or name in WRITE_OPERATIONS:
+            return _api_call(None, name, value)
+        return value
+
+
+def instrument(spreadsheet):
+    """Wrap a gspread Spreadsheet (or the offline fake) so all its API calls are rate-limited and counted"""
+    if spreadsheet is None or isinstance(spreadsheet, InstrumentedSpreadsheet):
+        return spreadsheet
+    return InstrumentedSpreadsheet(spreadsheet)
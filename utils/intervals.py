@@ -0,0 +1,97 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+import pandas as pd
+
+from utils.frames import booking_times
+from utils.indexes import normalize_phone
+
+
+def _active_intervals(rows):
+    """(start, end, label) of the bookings in rows that still hold a seat and have a parseable time"""
+    active = rows[~rows["is_cancelled"].astype(bool) & ~rows["is_rescheduled"].astype(bool)]
+    starts, ends = booking_times(active["Date"], active["Time"])
+    return [
+        (start, end, label) for start, end, label in zip(starts, ends, active.index)
+        if not (pd.isna(start) or pd.isna(end))
+    ]
+
+
+class _PhoneIntervals:
+    """One phone's booking intervals sorted by start; reach[i] is the latest end among the first i + 1"""
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.labels = [label for _, _, label in intervals]
+        self.reach = []
+        self._reach_from(0)
+
+    def _reach_from(self, i):
+        del self.reach[i:]
+        for end in self.ends[i:]:
+            self.reach.append(end if not self.reach or end > self.reach[-1] else self.reach[-1])
+
+    def add(self, start, end, label):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.labels.insert(i, label)
+        self._reach_from(i)
+
+    def discard(self, label):
+        if label in self.labels:
+            i = self.labels.index(label)
+            del self.starts[i], self.ends[i], self.labels[i]
+            self._reach_from(i)
+
+    def overlapping(self, start, end):
+        # ✅ Binary search past every interval starting at or after end, then walk back only while one
+        # of the remaining intervals can still reach past start
+        labels = []
+        i = bisect_left(self.starts, end) - 1
+        while i >= 0 and self.reach[i] > start:
+            if self.ends[i] > start:
+                labels.append(self.labels[i])
+            i -= 1
+        return labels[::-1]
+
+
+class BookingIntervals:
+    """Per-phone [start, end) times of the active bookings in a Bookings frame, for overlap checks.
+
+    A phone's intervals are built from its rows (via phone_index) on its first lookup and kept current
+    by update(), so a check costs O(log n) in that phone's bookings rather than a scan of the frame.
+    """
+
+    def __init__(self, frame, phone_index):
+        self.frame = frame
+        self._phone_index = phone_index
+        self._phones = {}
+        self._lock = threading.Lock()
+
+    def _intervals(self, phone):
+        intervals = self._phones.get(phone)
+        if intervals is None:
+            rows = self.frame.loc[self._phone_index.labels(phone)]
+            intervals = self._phones[phone] = _PhoneIntervals(_active_intervals(rows))
+        return intervals
+
+    def overlapping(self, phone, start, end):
+        """Labels of phone's active bookings whose time overlaps [start, end), earliest first"""
+        if pd.isna(start) or pd.isna(end):
+            return []
+        with self._lock:
+            return self._intervals(normalize_phone(phone)).overlapping(start, end)
+
+    def update(self, label):
+        """Re-read row label of the frame (just appended or re-flagged) into its phone's intervals"""
+        rows = self.frame.loc[[label]]
+        with self._lock:
+            intervals = self._phones.get(normalize_phone(rows.at[label, "Phone"]))
+            if intervals is None:
+                return  # built from the frame, row included, on the phone's first lookup
+            intervals.discard(label)
+            for start, end, _ in _active_intervals(rows):
+                intervals.add(start, end, label)
@@ -0,0 +1,158 @@
+import fcntl
+import json
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from typing import NamedTuple
+
+# Intent states, in order; "seating"/"appending" mark a Sheets write that may or may not have landed
+PENDING = "pending"
+SEATING = "seating"
+SEATED = "seated"
+APPENDING = "appending"
+FLUSHED = "flushed"
+REJECTED = "rejected"
+FAILED = "failed"
+OPEN_STATES = (PENDING, SEATING, SEATED, APPENDING)
+
+COLUMNS = "id, request_key, kind, payload, state, attempts"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS intents (
+    id INTEGER PRIMARY KEY,
+    request_key TEXT UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_intents_state ON intents (state, id);
+"""
+
+
+class Intent(NamedTuple):
+    """One journaled booking, cancel or reschedule and how far it has been written to Sheets"""
+    id: int
+    request_key: str
+    kind: str
+    payload: dict
+    state: str
+    attempts: int
+
+
+class Journal:
+    """Durable, append-only SQLite log of write intents, drained to Google Sheets in the background"""
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        # ✅ Every commit reaches the disk before a booking is confirmed
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def append(self, kind, payload, request_key=None):
+        """Durably record an intent; returns (intent, created), the existing one when request_key was seen"""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO intents (request_key, kind, payload, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (request_key, kind, json.dumps(payload, default=str), now, now)
+            )
+            created = cursor.rowcount == 1
+            if created:
+                row = conn.execute(f"SELECT {COLUMNS} FROM intents WHERE id = ?", (cursor.lastrowid,)).fetchone()
+            else:
+                row = conn.execute(f"SELECT {COLUMNS} FROM intents WHERE request_key = ?", (request_key,)).fetchone()
+        return self._intent(row), created
+
+    @staticmethod
+    def _intent(row):
+        intent_id, request_key, kind, payload, state, attempts = row
+        return Intent(intent_id, request_key, kind, json.loads(payload), state, attempts)
+
+    def get(self, request_key):
+        """The intent recorded under request_key, or None"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT {COLUMNS} FROM intents WHERE request_key = ?", (request_key,)).fetchone()
+        return None if row is None else self._intent(row)
+
+    def retire(self, request_key):
+        """Free request_key from its intent if that was rejected or failed, so a retry is journaled afresh"""
+        with closing(self._connect()) as conn, conn:
+            # ✅ Kept under a suffixed key, so the failed attempt stays traceable
+            conn.execute(
+                "UPDATE intents SET request_key = request_key || '#' || id, updated_at = ? "
+                "WHERE request_key = ? AND state IN (?, ?)",
+                (time.time(), request_key, REJECTED, FAILED)
+            )
+
+    def intents(self, ids):
+        """The intents with these ids, oldest first"""
+        ids = list(ids)
+        if not ids:
+            return []
+        placeholders = ", ".join("?" for _ in ids)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(f"SELECT {COLUMNS} FROM intents WHERE id IN ({placeholders}) ORDER BY id", ids)
+            return [self._intent(row) for row in rows]
+
+    @contextmanager
+    def draining(self):
+        """Hold this journal's drain lock, shared by every process that opens the same file"""
+        with open(f"{self.path}.lock", "a") as lock_file:
+            # ✅ Released by the kernel when the file closes, even if this process dies holding it
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def given_up(self):
+        """(intent, error) of every intent rejected or failed, newest first"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT {COLUMNS}, error FROM intents WHERE state IN (?, ?) ORDER BY id DESC", (REJECTED, FAILED)
+            ).fetchall()
+        return [(self._intent(row[:-1]), row[-1]) for row in rows]
+
+    def open_intents(self, limit=None):
+        """Intents not yet fully written to Sheets, oldest first"""
+        placeholders = ", ".join("?" for _ in OPEN_STATES)
+        query = f"SELECT {COLUMNS} FROM intents WHERE state IN ({placeholders}) ORDER BY id"
+        params = OPEN_STATES
+        if limit:
+            query += " LIMIT ?"
+            params += (limit,)
+        with closing(self._connect()) as conn:
+            return [self._intent(row) for row in conn.execute(query, params)]
+
+    def mark(self, intents, state, error=None):
+        """Move intents to state (one transaction for all of them)"""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "UPDATE intents SET state = ?, error = ?, updated_at = ? WHERE id = ?",
+                [(state, error, now, intent.id) for intent in intents]
+            )
+
+    def record_failure(self, intent, error, max_attempts):
+        """Count a failed flush attempt; the intent is given up as FAILED after max_attempts"""
+        attempts = intent.attempts + 1
+        state = FAILED if attempts >= max_attempts else intent.state
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE intents SET attempts = ?, state = ?, error = ?, updated_at = ? WHERE id = ?",
+                (attempts, state, str(error), time.time(), intent.id)
+            )
+        return state
+
+    def counts(self):
+        """Number of intents per state"""
+        with closing(self._connect()) as conn:
+            return dict(conn.execute("SELECT state, COUNT(*) FROM intents GROUP BY state").fetchall())
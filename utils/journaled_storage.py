@@ -0,0 +1,477 @@
+import logging
+import threading
+from collections import Counter
+
+import pandas as pd
+
+from utils.booking import booking_row, live_attendees, reserve_seats
+from utils.cache import expire
+from utils.config import get_setting
+from utils.frames import normalize_bookings
+from utils.gsheet import BOOKINGS, connect_to_gsheet, get_bookings, get_worksheet
+from utils.idempotency import get_idempotency_store
+from utils.indexes import SessionKey, normalize_phone
+from utils.journal import APPENDING, FAILED, FLUSHED, OPEN_STATES, PENDING, REJECTED, SEATED, SEATING, Journal
+from utils.refresher import request_refresh
+from utils.scheduler import write_priority
+from utils.shared_state import get_shared_state
+from utils.storage import BOOKING_FIELDS, FAILED_WRITE_FIELDS, StorageBackend
+
+logger = logging.getLogger("faraja.journal")
+
+DEFAULT_FLUSH_INTERVAL_SECONDS = 2
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_BATCH_SIZE = 100
+
+# What list_failed_writes tells a client about an intent given up, by its final state
+PROBLEMS = {REJECTED: "The session was full", FAILED: "Could not be saved"}
+
+# Fields of a booking or session kept in a journaled cancel/reschedule, enough to rebuild the row
+SESSION_PAYLOAD_FIELDS = [
+    "Therapy Name", "Therapist Name", "Online or Physical", "Date Available", "Start Time",
+    "End Time", "Faraja Center Location"
+]
+
+
+def _fields(row, fields, date_field):
+    """JSON-safe dict of a booking/session row, its date as "YYYY-MM-DD" """
+    values = {field: row[field] for field in fields}
+    values[date_field] = pd.to_datetime(values[date_field]).strftime("%Y-%m-%d")
+    return values
+
+
+def _as_row(values, date_field):
+    """Inverse of _fields: a row like those list_bookings/list_sessions return"""
+    return pd.Series({**values, date_field: pd.to_datetime(values[date_field])}, dtype=object)
+
+
+def _hold_token(intent):
+    """Seat hold (see utils.idempotency) of a journaled booking between its seat write and its row append"""
+    return f"journal:{intent.id}"
+
+
+def _seat_deltas(intent):
+    """(SessionKey, delta) pairs an intent still owes the Sessions counts"""
+    payload = intent.payload
+    if intent.kind == "book":
+        # ✅ Once "seating" the count write may have landed; the snapshot is re-read before it is dropped
+        return [(SessionKey(*payload["session"]), 1)] if intent.state in (PENDING, SEATING) else []
+    if intent.state != PENDING:
+        return []
+    deltas = [(SessionKey.from_booking(payload["booking"]), -1)]
+    if intent.kind == "reschedule":
+        deltas.append((SessionKey.from_session(payload["new_session"]), 1))
+    return deltas
+
+
+class JournaledStorage(StorageBackend):
+    """Confirms writes once they are journaled and fit the in-memory seat counts; a JournalFlusher
+    thread then writes them to Sheets through the wrapped SheetsStorage"""
+
+    def __init__(self, inner, journal, interval=DEFAULT_FLUSH_INTERVAL_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.inner = inner
+        self.journal = journal
+        self.max_attempts = max_attempts
+        self._lock = threading.RLock()
+        self._draining = threading.Lock()  # one drain at a time in this process; journal.draining() across them
+        self._open = {}  # intent id -> Intent not yet fully written to Sheets
+        self._deltas = Counter()  # SessionKey -> seats journaled but not yet in the Sessions snapshot
+
+        # ✅ Crash recovery: intents left open by the last run are owed again before anything new
+        for intent in journal.open_intents():
+            self._track(intent)
+        if self._open:
+            logger.warning(f"Recovered {len(self._open)} journaled writes not yet flushed to Sheets")
+
+        self.flusher = JournalFlusher(self, interval)
+        self.flusher.start()
+        if self._open:
+            self.flusher.wake()
+
+    def _track(self, intent):
+        with self._lock:
+            previous = self._open.pop(intent.id, None)
+            if previous is not None:
+                for key, delta in _seat_deltas(previous):
+                    self._deltas[key] -= delta
+            if intent.state in OPEN_STATES:
+                self._open[intent.id] = intent
+                for key, delta in _seat_deltas(intent):
+                    self._deltas[key] += delta
+
+    def _set_state(self, intents, state, error=None):
+        """Persist and track a state change; returns the updated intents"""
+        if not intents:
+            return []
+        self.journal.mark(intents, state, error)
+        updated = [intent._replace(state=state) for intent in intents]
+        for intent in updated:
+            self._track(intent)
+        return updated
+
+    def _free_seats(self, session_index, key):
+        """Seats left on a session by its live count, less those journaled but not yet counted in the snapshot.
+
+        A booking admitted against a stale snapshot would be confirmed now and rejected when flushed.
+        """
+        session = self.inner.list_sessions().loc[session_index]
+        _, _, sheet = connect_to_gsheet()
+        with write_priority():
+            current = live_attendees(sheet, session_index)
+        return int(session["Maximum Attendees"]) - current - self._deltas[key]
+
+    def _journal(self, kind, payload, request_key):
+        """Durably record an intent and count its seats; returns "Success" """
+        intent, created = self.journal.append(kind, payload, request_key)
+        if created:
+            self._track(intent)
+            self.flusher.wake()
+        return "Success"
+
+    def _replayed(self, request_key):
+        """"Success" when request_key's intent is open or flushed, or None when it is new.
+
+        A rejected or failed intent is not replayed: its key is retired and the retry journaled afresh.
+        """
+        intent = None if request_key is None else self.journal.get(request_key)
+        if intent is None:
+            return None
+        if intent.state in (REJECTED, FAILED):
+            self.journal.retire(request_key)
+            return None
+        return "Success"
+
+    # -- reads: the Sheets snapshots with journaled, unflushed writes laid over them
+
+    def connect(self):
+        self.inner.connect()
+
+    def list_sessions(self, refresh=False):
+        df = self.inner.list_sessions(refresh=refresh)
+        with self._lock:
+            deltas = {key: delta for key, delta in self._deltas.items() if delta}
+        if df.empty or not deltas:
+            return df
+
+        df = df.copy()
+        for key, delta in deltas.items():
+            idx = self.inner.find_session(key)
+            if idx is None or idx not in df.index:
+                continue
+            count = max(int(df.at[idx, "Current Attendees"]) + delta, 0)
+            df.at[idx, "Current Attendees"] = count
+            df.at[idx, "Booking Status"] = "Full" if count >= int(df.at[idx, "Maximum Attendees"]) else "Available"
+        return df
+
+    def find_session(self, key):
+        return self.inner.find_session(key)
+
+    def list_bookings(self, phone=None, refresh=False):
+        df = self.inner.list_bookings(phone=phone, refresh=refresh)
+        with self._lock:
+            intents = sorted(self._open.values())
+        phone = None if phone is None else normalize_phone(phone)
+
+        # Journaled rows not yet appended get negative labels, so they never collide with sheet rows
+        rows = {
+            -intent.id: intent.payload["row"] for intent in intents
+            if "row" in intent.payload
+            and (intent.kind == "book" or intent.state == PENDING)
+            and (phone is None or normalize_phone(intent.payload["row"][3]) == phone)
+        }
+        if rows:
+            pending = normalize_bookings(pd.DataFrame(list(rows.values()), index=list(rows), columns=BOOKING_FIELDS))
+            df = pending if df.empty else pd.concat([df, pending])
+
+        changes = [intent for intent in intents if intent.kind != "book" and intent.state == PENDING]
+        if df.empty or not changes:
+            return df
+
+        df = df.copy()
+        for intent in changes:
+            booking = intent.payload["booking"]
+            match = (
+                (df["Phone"] == normalize_phone(booking["Phone"])) &
+                (df["Therapy Name"] == booking["Therapy Name"]) &
+                (df["Therapist"] == booking["Therapist"]) &
+                (df["Date"] == pd.to_datetime(booking["Date"])) &
+                (df["Time"] == booking["Time"]) &
+                ~df["is_cancelled"] & ~df["is_rescheduled"]
+            )
+            if match.any():
+                flag = "is_cancelled" if intent.kind == "cancel" else "is_rescheduled"
+                df.loc[match.idxmax(), [flag, "reason"]] = [True, intent.payload["reason"]]
+        return df
+
+    def list_archived_bookings(self, phone=None):
+        return self.inner.list_archived_bookings(phone=phone)
+
+    def list_failed_writes(self, phone):
+        phone = normalize_phone(phone)
+        rows = []
+        for intent, _ in self.journal.given_up():
+            payload = intent.payload
+            booking = dict(zip(BOOKING_FIELDS, payload["row"])) if intent.kind == "book" else payload["booking"]
+            if normalize_phone(booking["Phone"]) == phone:
+                rows.append([
+                    intent.kind.capitalize(), booking["Therapy Name"], booking["Therapist"], booking["Date"],
+                    booking["Time"], PROBLEMS[intent.state]
+                ])
+        df = pd.DataFrame(rows, columns=FAILED_WRITE_FIELDS)
+        df["Date"] = pd.to_datetime(df["Date"])
+        return df
+
+    # -- writes: validated and journaled here, written to Sheets by the flusher
+
+    def book(self, session_index, name, gender, attendee_type, phone, alt_phone=None, request_key=None):
+        try:
+            replayed = self._replayed(request_key)
+            if replayed is not None:
+                return replayed
+
+            with self._lock:
+                # ✅ Read under the lock: the flusher cannot drop a delta between the live count and the check
+                session = self.inner.list_sessions().loc[session_index]
+                key = SessionKey.from_session(session)
+                if self._free_seats(session_index, key) <= 0:
+                    return "Full"
+                payload = {
+                    "session": list(key),
+                    "row": booking_row(name, gender, attendee_type, phone, session, alt_phone)
+                }
+                return self._journal("book", payload, request_key)
+
+        except Exception as e:
+            logger.exception(f"❌ Error journaling booking: {e}")
+            return "Error"
+
+    def cancel(self, selected_session, reason, request_key=None):
+        try:
+            replayed = self._replayed(request_key)
+            if replayed is not None:
+                return replayed
+
+            payload = {"booking": _fields(selected_session, BOOKING_FIELDS, "Date"), "reason": reason}
+            with self._lock:
+                return self._journal("cancel", payload, request_key)
+
+        except Exception as e:
+            logger.exception(f"❌ Error journaling cancellation: {e}")
+            return "Error"
+
+    def reschedule(self, selected_session, reason, new_session, request_key=None):
+        try:
+            replayed = self._replayed(request_key)
+            if replayed is not None:
+                return replayed
+
+            new_key = SessionKey.from_session(new_session)
+            new_idx = self.inner.find_session(new_key)
+            with self._lock:
+                if new_idx is None or self._free_seats(new_idx, new_key) <= 0:
+                    logger.warning("❌ The new session is already full.")
+                    return "Error"
+                payload = {
+                    "booking": _fields(selected_session, BOOKING_FIELDS, "Date"),
+                    "new_session": _fields(new_session, SESSION_PAYLOAD_FIELDS, "Date Available"),
+                    "reason": reason,
+                    "row": booking_row(
+                        selected_session["Name"], selected_session["Gender"], selected_session["Attendee Type"],
+                        selected_session["Phone"], new_session
+                    )
+                }
+                return self._journal("reschedule", payload, request_key)
+
+        except Exception as e:
+            logger.exception(f"❌ Error journaling reschedule: {e}")
+            return "Error"
+
+    # -- flushing
+
+    def drain(self, limit=DEFAULT_BATCH_SIZE):
+        """Write open intents to Sheets in journal order, consecutive bookings in one batch; returns how many.
+
+        Every process using the journal file drains it, one at a time, so no intent is written twice.
+        """
+        with self._draining, self.journal.draining():
+            self._catch_up()
+            return self._drain(self.journal.open_intents(limit))
+
+    def _catch_up(self):
+        """Track the current state of intents another process may have flushed since this one journaled them"""
+        with self._lock:
+            tracked = dict(self._open)
+        for intent in self.journal.intents(tracked):
+            if intent != tracked[intent.id]:
+                self._track(intent)
+
+    def _drain(self, intents):
+        done = 0
+        while done < len(intents):
+            end = done
+            while end < len(intents) and intents[end].kind == "book":
+                end += 1
+            group = intents[done:end] or intents[done:done + 1]
+            try:
+                if group[0].kind == "book":
+                    self._flush_bookings(group)
+                else:
+                    self._flush_change(group[0])
+            except Exception as e:
+                logger.exception(f"❌ Error flushing journaled {group[0].kind}: {e}")
+                self._record_failure(group, e)
+                # ✅ Later intents may depend on these (e.g. cancelling a journaled booking): keep the order
+                break
+            done += len(group)
+        return done
+
+    def _record_failure(self, intents, error):
+        for intent in intents:
+            current = self._open.get(intent.id)
+            if current is None:  # already flushed or rejected before the failure
+                continue
+            state = self.journal.record_failure(current, error, self.max_attempts)
+            self._track(current._replace(state=state, attempts=current.attempts + 1))
+            if state == FAILED:
+                get_idempotency_store().release_seats(_hold_token(intent))  # reconcile may give its seat back
+                # Shown to the client by list_failed_writes (the Manage page) as well
+                logger.error(f"❌ Gave up writing journaled {intent.kind} #{intent.id} to Sheets: {intent.payload}")
+
+    @write_priority()
+    def _flush_bookings(self, intents):
+        _, _, sheet = connect_to_gsheet()
+        pending = [intent for intent in intents if intent.state == PENDING]
+        seated = [intent for intent in intents if intent.state in (SEATED, APPENDING)]
+        recovered = [intent for intent in intents if intent.state == SEATING]
+        if recovered:
+            # ✅ The count write may or may not have landed before the crash; assume it did
+            logger.warning(f"Assuming {len(recovered)} interrupted seat writes reached Sheets")
+            seated += self._set_state(recovered, SEATED)
+
+        if pending:
+            seated += self._seat(sheet, pending)
+        if seated:
+            self._append(sorted(seated))
+
+    def _seat(self, sheet, intents):
+        """Take the seats for pending bookings in one batch; returns those seated, rejects the rest"""
+        requested = {}
+        for intent in intents:
+            idx = self.inner.find_session(SessionKey(*intent.payload["session"]))
+            requested.setdefault(idx, []).append(intent)
+        missing = requested.pop(None, [])
+        seating = [intent for group in requested.values() for intent in group]
+        holds = get_idempotency_store()
+
+        def before_write():
+            # ✅ Held until the rows are appended, so reconcile never hands these seats back in between
+            holds.hold_seats({_hold_token(intent): SessionKey(*intent.payload["session"]) for intent in seating})
+            self._set_state(seating, SEATING)
+
+        granted = reserve_seats(sheet, {idx: len(group) for idx, group in requested.items()}, before_write)
+        seated, rejected = [], list(missing)
+        for idx, group in requested.items():
+            seated += group[:granted[idx]]
+            rejected += group[granted[idx]:]
+
+        # ✅ Drop the journal deltas only now that the Sessions snapshot carries the new counts
+        seated = self._set_state(seated, SEATED)
+        if rejected:
+            for intent in rejected:
+                logger.error(f"❌ Journaled booking #{intent.id} no longer fits its session: {intent.payload}")
+            self._set_state(rejected, REJECTED, "session full or missing when written")
+            holds.release_seats(*map(_hold_token, rejected))
+        return seated
+
+    def _already_appended(self, intent):
+        """Whether an interrupted append of this booking's row reached the Bookings sheet"""
+        row = dict(zip(BOOKING_FIELDS, intent.payload["row"]))
+        df = get_bookings(phone=row["Phone"], refresh=True)
+        return not df.empty and (
+            (df["Timestamp"].astype(str) == row["Timestamp"]) & (df["Time"] == row["Time"]) &
+            (df["Therapy Name"] == row["Therapy Name"])
+        ).any()
+
+    def _append(self, intents):
+        """Append the Bookings rows of seated intents in one call"""
+        interrupted = [intent for intent in intents if intent.state == APPENDING]
+        landed = [intent for intent in interrupted if self._already_appended(intent)]
+        self._set_state(landed, FLUSHED)
+        holds = get_idempotency_store()
+        holds.release_seats(*map(_hold_token, landed))
+        intents = [intent for intent in intents if intent not in landed]
+        if not intents:
+            return
+
+        intents = self._set_state(intents, APPENDING)
+        get_worksheet(BOOKINGS).append_rows([intent.payload["row"] for intent in intents])
+        self._set_state(intents, FLUSHED)
+        holds.release_seats(*map(_hold_token, intents))
+        expire(BOOKINGS)
+        request_refresh(BOOKINGS)
+
+    def _flush_change(self, intent):
+        """Write a journaled cancel/reschedule through the Sheets backend, keyed so a retry cannot repeat it"""
+        payload = intent.payload
+        booking = _as_row(payload["booking"], "Date")
+        key = intent.request_key or f"journal:{intent.id}"
+        if intent.kind == "cancel":
+            status = self.inner.cancel(booking, payload["reason"], request_key=key)
+        else:
+            new_session = _as_row(payload["new_session"], "Date Available")
+            status = self.inner.reschedule(booking, payload["reason"], new_session, request_key=key)
+        if status != "Success":
+            raise RuntimeError(f"{intent.kind} could not be written to Sheets")
+        self._set_state([intent], FLUSHED)
+
+
+class JournalFlusher(threading.Thread):
+    """Daemon thread draining the journal to Sheets every interval, or as soon as it is woken"""
+
+    def __init__(self, storage, interval):
+        super().__init__(name="journal-flusher", daemon=True)
+        self.storage = storage
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                # ✅ Keep going while full batches come back: a backlog drains without waiting a whole interval
+                while self.storage.drain() == DEFAULT_BATCH_SIZE:
+                    pass
+            except Exception:
+                logger.exception("Journal flush failed")
+
+
+def journal_enabled():
+    """Whether Sheets writes go through the write-ahead journal ([journal] enabled)"""
+    return str(get_setting("journal", "enabled", False)).strip().lower() in ("1", "true", "yes")
+
+
+def journaled(inner):
+    """Wrap a SheetsStorage with the journal at [journal] path, flushed every [journal] interval_seconds.
+
+    Refused together with [shared] state: journaled bookings are admitted against this replica's own
+    snapshot and ledger, never the replicas' shared seat counters, so two replicas could sell one seat.
+    """
+    if get_shared_state() is not None:
+        raise ValueError("[journal] enabled cannot be combined with a [shared] backend")
+    return JournaledStorage(
+        inner,
+        Journal(get_setting("journal", "path", "faraja_journal.db")),
+        interval=float(get_setting("journal", "interval_seconds", DEFAULT_FLUSH_INTERVAL_SECONDS)),
+        max_attempts=int(get_setting("journal", "max_attempts", DEFAULT_MAX_ATTEMPTS)),
+    )
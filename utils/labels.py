@@ -0,0 +1,27 @@
+def _text(column):
+    return column.astype(str)
+
+
+def session_labels(df):
+    """Selectbox labels for Sessions rows, indexed like df"""
+    return (
+        _text(df["Therapy Name"]) + " - " + _text(df["Therapist Name"]) + " - " + _text(df["Faraja Center Location"])
+        + " - " + df["Date Available"].dt.strftime("%Y-%m-%d") + " " + _text(df["Start Time"]) + " to "
+        + _text(df["End Time"]) + " (Status: " + _text(df["Booking Status"]) + ")"
+    )
+
+
+def booking_labels(df):
+    """Selectbox labels for Bookings rows, indexed like df"""
+    return (
+        _text(df["Therapy Name"]) + " with " + _text(df["Therapist"]) + " on "
+        + df["Date"].dt.strftime("%Y-%m-%d") + " at " + _text(df["Time"])
+    )
+
+
+def reschedule_labels(df):
+    """Selectbox labels for the Sessions rows a booking can move to, indexed like df"""
+    return (
+        _text(df["Therapy Name"]) + " with " + _text(df["Therapist Name"]) + " on "
+        + df["Date Available"].dt.strftime("%Y-%m-%d") + " at " + _text(df["Start Time"]) + " - " + _text(df["End Time"])
+    )
@@ -0,0 +1,97 @@
+import fcntl
+import os
+import sqlite3
+import time
+from contextlib import ExitStack, closing, contextmanager
+
+from utils.shared_state import DEFAULT_SEAT_TTL_SECONDS, SharedState
+from utils.snapshot_store import SnapshotStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seats (
+    session TEXT PRIMARY KEY,
+    taken INTEGER NOT NULL,
+    seeded_at REAL NOT NULL
+);
+"""
+
+
+def _session(key):
+    return "|".join(key)
+
+
+class LocalSharedState(SharedState):
+    """Shared state for every process on one machine: Parquet snapshots, flock() seat locks and SQLite counters"""
+
+    def __init__(self, directory, seat_ttl_seconds=DEFAULT_SEAT_TTL_SECONDS):
+        self.directory = directory
+        self.seat_ttl_seconds = seat_ttl_seconds
+        self.snapshots = SnapshotStore(os.path.join(directory, "snapshots"))
+        os.makedirs(os.path.join(directory, "locks"), mode=0o700, exist_ok=True)
+        self.path = os.path.join(directory, "seats.db")
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load_snapshot(self, name, source, loaded_after):
+        return self.snapshots.load(name, source, loaded_after=loaded_after)
+
+    def save_snapshot(self, name, frame, source, loaded_at, **extra):
+        self.snapshots.save(name, frame, source, loaded_at=loaded_at, **extra)
+
+    def discard_snapshots(self, *names):
+        for name in names:
+            self.snapshots.delete(name)
+
+    @contextmanager
+    def holding(self, *session_indexes):
+        with ExitStack() as stack:
+            for session_index in sorted(set(session_indexes)):
+                lock_file = stack.enter_context(
+                    open(os.path.join(self.directory, "locks", f"session-{session_index}.lock"), "a")
+                )
+                # ✅ Released by the kernel when the file closes, even if this process dies holding it
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _counter(self, conn, session):
+        """Current count of session, or None when unknown or due to be re-read from the sheet"""
+        row = conn.execute("SELECT taken, seeded_at FROM seats WHERE session = ?", (session,)).fetchone()
+        if row is None or time.time() - row[1] > self.seat_ttl_seconds:
+            return None
+        return row[0]
+
+    def take_seat(self, key, capacity, current):
+        session = _session(key)
+        with closing(self._connect()) as conn:
+            # ✅ Read the sheet outside the write transaction, so other sessions' seats are never kept waiting
+            live = current() if self._counter(conn, session) is None else None
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                taken = self._counter(conn, session)
+                seeded_at = None
+                if taken is None:
+                    taken = live if live is not None else current()
+                    seeded_at = time.time()
+                granted = taken < capacity
+                if granted:
+                    taken += 1
+                conn.execute(
+                    "INSERT INTO seats (session, taken, seeded_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (session) DO UPDATE SET taken = excluded.taken, "
+                    "seeded_at = COALESCE(?, seeded_at)",
+                    (session, taken, seeded_at or time.time(), seeded_at)
+                )
+        return granted, taken
+
+    def set_seats(self, counts):
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT INTO seats (session, taken, seeded_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (session) DO UPDATE SET taken = excluded.taken, seeded_at = excluded.seeded_at",
+                [(_session(key), int(count), now) for key, count in counts.items()]
+            )
@@ -0,0 +1,124 @@
+"""Recompute Current Attendees and Booking Status from the Bookings sheet and fix the cells that drifted.
+
+    python -m utils.reconcile [--dry-run] [--every SECONDS]
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.booking import holding_seats, set_session_counts
+from utils.gsheet import connect_to_gsheet, get_bookings, get_sessions
+from utils.idempotency import get_idempotency_store
+from utils.indexes import SessionKey
+from utils.instrumentation import configure_logging
+
+logger = logging.getLogger("faraja.reconcile")
+
+# Bookings columns that identify the session a booking holds a seat on
+KEY_COLUMNS = ["Therapy Name", "Therapist", "Date", "Time"]
+
+
+def _key_frame(therapy, therapist, dates, times, index):
+    return pd.DataFrame({
+        "Therapy Name": therapy.astype(str).to_numpy(),
+        "Therapist": therapist.astype(str).to_numpy(),
+        "Date": pd.to_datetime(dates, errors="coerce").dt.strftime("%Y-%m-%d").to_numpy(),
+        "Time": times.astype(str).to_numpy(),
+    }, index=index)
+
+
+def attendee_counts(sessions, bookings):
+    """Active (not cancelled or rescheduled) bookings per session, aligned to the Sessions index"""
+    if sessions.empty:
+        return pd.Series(dtype=int)
+    keys = _key_frame(
+        sessions["Therapy Name"], sessions["Therapist Name"], sessions["Date Available"],
+        sessions["Start Time"].astype(str) + " - " + sessions["End Time"].astype(str), sessions.index
+    )
+    if bookings.empty:
+        return pd.Series(0, index=sessions.index)
+
+    active = bookings[~bookings["is_cancelled"] & ~bookings["is_rescheduled"]]
+    # ✅ One grouped pass over Bookings instead of a filter per session
+    counts = _key_frame(
+        active["Therapy Name"], active["Therapist"], active["Date"], active["Time"], active.index
+    ).groupby(KEY_COLUMNS).size().rename("count")
+    return keys.join(counts, on=KEY_COLUMNS)["count"].fillna(0).astype(int)
+
+
+def find_drift(sessions, bookings):
+    """Sessions whose count or status disagrees with Bookings: current/expected count and status per index"""
+    if sessions.empty:
+        return pd.DataFrame(columns=["current", "expected", "status", "expected_status"])
+    expected = attendee_counts(sessions, bookings)
+    expected_status = np.where(expected >= sessions["Maximum Attendees"], "Full", "Available")
+    report = pd.DataFrame({
+        "current": sessions["Current Attendees"],
+        "expected": expected,
+        "status": sessions["Booking Status"].astype(str),
+        "expected_status": expected_status,
+    }, index=sessions.index)
+    return report[(report["current"] != report["expected"]) | (report["status"] != report["expected_status"])]
+
+
+def _upcoming(sessions):
+    # ✅ Past sessions' bookings may already be archived out of Bookings, and their seats no longer matter
+    if sessions.empty:
+        return sessions
+    return sessions[sessions["Date Available"] >= pd.Timestamp.today().normalize()]
+
+
+def reconcile(dry_run=False):
+    """Fix drifted attendee counts of upcoming sessions in one batch write; returns the drift found"""
+    _, _, sheet = connect_to_gsheet()
+    drift = find_drift(_upcoming(get_sessions(sheet, refresh=True)), get_bookings(refresh=True))
+    if drift.empty or dry_run:
+        return drift
+
+    with holding_seats(*drift.index):
+        # ✅ A booking between its seat write and its row append looks like drift: its seat is held (see
+        # utils.idempotency) from before the write until after the append, so sessions with a hold are left
+        # alone. The holds are read before the sheet, so a hold released meanwhile already shows its row.
+        held = get_idempotency_store().held_sessions()
+        sessions = _upcoming(get_sessions(sheet, refresh=True))
+        confirmed = find_drift(sessions, get_bookings(refresh=True))
+        confirmed = confirmed[
+            confirmed.index.isin(drift.index) &
+            (confirmed["expected"] == drift["expected"].reindex(confirmed.index)) &
+            np.array([SessionKey.from_session(sessions.loc[idx]) not in held for idx in confirmed.index], dtype=bool)
+        ]
+        if not confirmed.empty:
+            set_session_counts(sheet, {
+                idx: (int(fix.expected), fix.expected_status) for idx, fix in confirmed.iterrows()
+            })
+
+    for idx, fix in confirmed.iterrows():
+        logger.warning(f"Session row {idx + 2}: {fix.current} -> {fix.expected} attendees ({fix.expected_status})")
+    return confirmed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="report drifted sessions without writing")
+    parser.add_argument("--every", type=float, default=0, help="repeat every SECONDS (0 = run once)")
+    args = parser.parse_args()
+    configure_logging()
+
+    while True:
+        started = time.perf_counter()
+        drift = reconcile(dry_run=args.dry_run)
+        if args.dry_run and not drift.empty:
+            print(drift.to_string())
+        logger.info(
+            f"{len(drift)} session(s) {'drifted' if args.dry_run else 'fixed'} in {time.perf_counter() - started:.2f}s"
+        )
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import logging
+import threading
+
+from utils.config import get_setting
+
+logger = logging.getLogger("faraja.refresher")
+
+DEFAULT_INTERVAL_SECONDS = 15
+# Readers only fall back to a synchronous fetch once a snapshot is this many intervals old
+STALE_INTERVALS = 10
+
+
+class SnapshotRefresher(threading.Thread):
+    """Daemon thread that re-fetches snapshots every interval, or right away for the names requested"""
+
+    def __init__(self, refreshers, interval):
+        super().__init__(name="snapshot-refresher", daemon=True)
+        self.refreshers = refreshers  # snapshot name -> callable that reloads it
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._requested = set()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def request(self, *names):
+        """Refresh the given snapshots (all of them when no name is given) as soon as possible"""
+        with self._lock:
+            self._requested.update(names or self.refreshers)
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def run(self):
+        self.request()
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self._lock:
+                names, self._requested = self._requested or set(self.refreshers), set()
+            for name in sorted(names):
+                try:
+                    self.refreshers[name]()
+                except Exception:
+                    logger.exception(f"Background refresh of {name} failed")
+
+
+_lock = threading.Lock()
+_refresher = None
+
+
+def get_interval():
+    """Seconds between background refreshes, from [refresh] interval_seconds (0 disables the refresher)"""
+    return float(get_setting("refresh", "interval_seconds", DEFAULT_INTERVAL_SECONDS))
+
+
+def start_refresher(refreshers, interval=None):
+    """Start the process-wide refresher once; later calls return the running one (None when disabled)"""
+    global _refresher
+    interval = get_interval() if interval is None else interval
+    with _lock:
+        if _refresher is None and interval > 0:
+            _refresher = SnapshotRefresher(refreshers, interval)
+            _refresher.start()
+        return _refresher
+
+
+def get_refresher():
+    """The running refresher, or None when it is disabled or not started"""
+    return _refresher
+
+
+def request_refresh(*names):
+    """Ask the running refresher (if any) to re-fetch the given snapshots now"""
+    refresher = _refresher
+    if refresher is not None:
+        refresher.request(*names)
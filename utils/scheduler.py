@@ -0,0 +1,156 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import gspread
+
+from utils.config import get_setting
+from utils.singleflight import SingleFlight
+
+logger = logging.getLogger("faraja.scheduler")
+
+# Per-user Sheets API quotas (requests per minute); a service account counts as one user
+DEFAULT_READS_PER_MINUTE = 60
+DEFAULT_WRITES_PER_MINUTE = 60
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 32.0
+
+# Lower goes first when several calls wait for the same bucket
+WRITE_PRIORITY = 0
+READ_PRIORITY = 1
+
+RETRYABLE_STATUS = 429
+
+
+class TokenBucket:
+    """Blocking token bucket refilled at rate_per_minute, served in (priority, arrival) order; None = unlimited"""
+
+    def __init__(self, rate_per_minute, burst=None, clock=time.monotonic):
+        self.rate = None if not rate_per_minute else float(rate_per_minute) / 60
+        self.capacity = float(burst or rate_per_minute or 0)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._cond = threading.Condition()
+        self._waiting = []  # heap of (priority, arrival)
+        self._arrivals = itertools.count()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority=READ_PRIORITY):
+        """Take one token, waiting behind every earlier or higher-priority caller; returns seconds waited"""
+        if self.rate is None:
+            return 0.0
+
+        started = self._clock()
+        with self._cond:
+            ticket = (priority, next(self._arrivals))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    self._refill()
+                    if self._waiting[0] == ticket:
+                        if self.tokens >= 1:
+                            self.tokens -= 1
+                            return self._clock() - started
+                        self._cond.wait((1 - self.tokens) / self.rate)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+
+def is_retryable(error, idempotent=True):
+    """429s are always safe to retry; 5xx only when repeating the call cannot apply it twice"""
+    code = getattr(error, "code", None)
+    if code == RETRYABLE_STATUS:
+        return True
+    return idempotent and isinstance(code, int) and code >= 500
+
+
+# ✅ A context variable, so the priority follows calls handed to worker threads by asyncio.to_thread
+_priority = ContextVar("sheets_priority", default=READ_PRIORITY)
+
+
+def current_priority():
+    return _priority.get()
+
+
+@contextmanager
+def write_priority():
+    """Give every call made inside the block write priority and a fresh (uncoalesced) read"""
+    token = _priority.set(WRITE_PRIORITY)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class QuotaScheduler:
+    """Rate-limits Sheets calls per read/write quota, coalesces identical reads and retries 429/5xx"""
+
+    def __init__(
+        self, reads_per_minute=DEFAULT_READS_PER_MINUTE, writes_per_minute=DEFAULT_WRITES_PER_MINUTE,
+        max_retries=DEFAULT_MAX_RETRIES, backoff_seconds=DEFAULT_BACKOFF_SECONDS
+    ):
+        self.buckets = {"read": TokenBucket(reads_per_minute), "write": TokenBucket(writes_per_minute)}
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._reads = SingleFlight()
+
+    def run(self, kind, fn, key=None, idempotent=True):
+        """Call fn() under the kind ("read"/"write") quota; reads with a key share identical in-flight calls"""
+        priority = WRITE_PRIORITY if kind == "write" else current_priority()
+        if kind == "read" and key is not None and priority == READ_PRIORITY:
+            # ✅ Reads inside a booking (write priority) always go to the sheet for live values
+            return self._reads.do(key, lambda: self._call(kind, priority, fn, idempotent))
+        return self._call(kind, priority, fn, idempotent)
+
+    def _call(self, kind, priority, fn, idempotent):
+        for attempt in range(self.max_retries + 1):
+            self.buckets[kind].acquire(priority)
+            try:
+                return fn()
+            except gspread.exceptions.APIError as e:
+                if attempt == self.max_retries or not is_retryable(e, idempotent):
+                    raise
+                # ✅ Full jitter keeps concurrent sessions from retrying in lockstep
+                delay = random.uniform(0, min(MAX_BACKOFF_SECONDS, self.backoff_seconds * 2 ** attempt))
+                logger.warning(f"Sheets {kind} failed with {getattr(e, 'code', '?')}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+
+_lock = threading.Lock()
+_scheduler = None
+
+
+def get_scheduler():
+    """Return the process-wide scheduler, sized by [quota] reads_per_minute/writes_per_minute (0 = unlimited)"""
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = QuotaScheduler(
+                reads_per_minute=float(get_setting("quota", "reads_per_minute", DEFAULT_READS_PER_MINUTE)),
+                writes_per_minute=float(get_setting("quota", "writes_per_minute", DEFAULT_WRITES_PER_MINUTE)),
+                max_retries=int(get_setting("quota", "max_retries", DEFAULT_MAX_RETRIES)),
+                backoff_seconds=float(get_setting("quota", "backoff_seconds", DEFAULT_BACKOFF_SECONDS)),
+            )
+        return _scheduler
+
+
+def set_scheduler(scheduler):
+    """Replace the process-wide scheduler (e.g. an unlimited one for offline benchmarks)"""
+    global _scheduler
+    with _lock:
+        _scheduler = scheduler
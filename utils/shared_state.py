@@ -0,0 +1,75 @@
+import threading
+
+from utils.config import get_setting
+
+DEFAULT_SEAT_TTL_SECONDS = 300
+
+
+class SharedState:
+    """Interface for state shared by every app process (replica): snapshots, seat locks and seat counters.
+
+    LocalSharedState keeps it in files on one machine; implement these methods over a networked store
+    (e.g. Redis) and install it with set_shared_state to share it across machines.
+    """
+
+    def load_snapshot(self, name, source, loaded_after):
+        """(frame, marker) last published for name from source if loaded after loaded_after (wall-clock), else None"""
+        raise NotImplementedError
+
+    def save_snapshot(self, name, frame, source, loaded_at, **extra):
+        """Publish frame, loaded from the spreadsheet at loaded_at (wall-clock), as the latest copy of name"""
+        raise NotImplementedError
+
+    def discard_snapshots(self, *names):
+        """Forget the published copies of names, e.g. after rows were deleted from their tab"""
+        raise NotImplementedError
+
+    def holding(self, *session_indexes):
+        """Context manager holding the sessions' cross-process seat locks, acquired in sorted order"""
+        raise NotImplementedError
+
+    def take_seat(self, key, capacity, current):
+        """Atomically take a seat on session key (a SessionKey) if fewer than capacity are taken.
+
+        current() returns the live count from the sheet; it is called only when the counter is unknown
+        or older than its TTL. Returns (taken, count after the attempt).
+        """
+        raise NotImplementedError
+
+    def set_seats(self, counts):
+        """Overwrite {SessionKey: count} with counts just written to the sheet"""
+        raise NotImplementedError
+
+
+_lock = threading.Lock()
+_shared = None
+_configured = False
+
+
+def get_shared_state():
+    """Process-wide shared state selected by [shared] backend ("none" or "local"), or None when off.
+
+    Not supported together with [journal] enabled (see utils.journaled_storage.journaled).
+    """
+    global _shared, _configured
+    with _lock:
+        if not _configured:
+            backend = get_setting("shared", "backend", "none")
+            if backend == "local":
+                from utils.local_shared_state import LocalSharedState
+                _shared = LocalSharedState(
+                    get_setting("shared", "path", "faraja_shared"),
+                    float(get_setting("shared", "seat_ttl_seconds", DEFAULT_SEAT_TTL_SECONDS))
+                )
+            elif backend != "none":
+                raise ValueError(f"Unknown shared state backend: {backend}")
+            _configured = True
+        return _shared
+
+
+def set_shared_state(shared):
+    """Replace the process-wide shared state, e.g. with a networked SharedState; None turns it off"""
+    global _shared, _configured
+    with _lock:
+        _shared = shared
+        _configured = True
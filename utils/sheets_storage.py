@@ -0,0 +1,110 @@
+import uuid
+
+from utils.booking import book_session, cancel_booking, find_session_index, reschedule_booking, save_booking
+from utils.gsheet import (
+    connect_to_gsheet, find_overlapping_bookings, get_archived_bookings, get_bookings, get_sessions,
+    start_background_refresh
+)
+from utils.idempotency import get_idempotency_store, operation
+from utils.indexes import SessionKey
+from utils.storage import StorageBackend
+
+
+class SheetsStorage(StorageBackend):
+    """Sessions on the first worksheet and bookings on "Bookings", via the pooled gspread client"""
+
+    def __init__(self):
+        start_background_refresh()
+
+    def connect(self):
+        connect_to_gsheet()
+
+    def list_sessions(self, refresh=False):
+        _, _, sheet = connect_to_gsheet()
+        return get_sessions(sheet, refresh=refresh)
+
+    def find_session(self, key):
+        return find_session_index(key)
+
+    def list_bookings(self, phone=None, refresh=False):
+        return get_bookings(phone=phone, refresh=refresh)
+
+    def find_overlapping_bookings(self, phone, starts_at, ends_at, refresh=False):
+        return find_overlapping_bookings(phone, starts_at, ends_at, refresh=refresh)
+
+    def list_archived_bookings(self, phone=None):
+        return get_archived_bookings(phone=phone)
+
+    def book(self, session_index, name, gender, attendee_type, phone, alt_phone=None, request_key=None):
+        with operation(request_key, "book") as op:
+            if op.done:
+                return op.result
+
+            _, spreadsheet, sheet = connect_to_gsheet()
+            df = get_sessions(sheet)
+            holds = get_idempotency_store()
+            hold = request_key or uuid.uuid4().hex
+            # ✅ A retry after the row failed to save only writes the row, while the seat is still held;
+            # once the hold lapses reconcile may have handed the seat back, so it is taken again
+            if not (op.has("seat") and holds.holds_seat(hold)):
+                key = SessionKey.from_session(df.loc[session_index])
+                status = book_session(sheet, df, session_index, before_write=lambda: holds.hold_seats({hold: key}))
+                if status != "Success":
+                    holds.release_seats(hold)
+                    return status
+                op.step("seat")
+
+            if not save_booking(spreadsheet, name, gender, attendee_type, phone, df.loc[session_index], alt_phone):
+                if request_key is None:
+                    holds.release_seats(hold)  # nothing will resume it: let reconcile give the seat back
+                return "Error"
+            holds.release_seats(hold)
+            return op.finish("Success")
+
+    def cancel(self, selected_session, reason, request_key=None):
+        with operation(request_key, "cancel") as op:
+            if op.done:
+                return op.result
+
+            _, spreadsheet, _ = connect_to_gsheet()
+            status = cancel_booking(spreadsheet, selected_session, reason)
+            return op.finish(status) if status == "Success" else status
+
+    def reschedule(self, selected_session, reason, new_session, request_key=None):
+        with operation(request_key, "reschedule") as op:
+            if op.done:
+                return op.result
+
+            _, spreadsheet, sheet = connect_to_gsheet()
+            holds = get_idempotency_store()
+            hold = request_key or uuid.uuid4().hex
+            new_key = SessionKey.from_session(new_session)
+
+            def hold_seat():
+                holds.hold_seats({hold: new_key})
+
+            if op.has("moved"):
+                if not holds.holds_seat(hold):
+                    # ✅ The moved seat's hold lapsed and reconcile may have handed it back: take it again
+                    df = get_sessions(sheet)
+                    new_idx = find_session_index(new_key)
+                    if new_idx is None or book_session(sheet, df, new_idx, before_write=hold_seat) != "Success":
+                        holds.release_seats(hold)
+                        return "Error"
+                saved = save_booking(
+                    spreadsheet, selected_session["Name"], selected_session["Gender"],
+                    selected_session["Attendee Type"], selected_session["Phone"], new_session
+                )
+                if not saved:
+                    return "Error"
+                holds.release_seats(hold)
+                return op.finish("Success")
+
+            status = reschedule_booking(spreadsheet, selected_session, reason, new_session, before_write=hold_seat)
+            if status == "Unsaved" and request_key is not None:
+                op.step("moved")
+                return "Error"
+            holds.release_seats(hold)
+            if status == "Unsaved":
+                return "Error"
+            return op.finish(status) if status == "Success" else status
@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.config import get_setting
+
+logger = logging.getLogger("faraja.snapshot")
+
+# Bump whenever the normalized frame layout changes, so files written by older code are ignored
+SNAPSHOT_FORMAT = 1
+DEFAULT_MAX_AGE_SECONDS = 86400
+MARKER_KEY = b"faraja"
+
+
+class SnapshotStore:
+    """Normalized worksheet frames saved as Parquet files, each tagged with a version marker"""
+
+    def __init__(self, directory, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        self.directory = directory
+        self.max_age_seconds = max_age_seconds
+        # ✅ The frames hold names and phone numbers: keep them readable by this user only
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name.lower()}.parquet")
+
+    def save(self, name, frame, source, **extra):
+        """Atomically replace the saved frame for name; source identifies the spreadsheet it came from"""
+        marker = {"format": SNAPSHOT_FORMAT, "source": source, "saved_at": time.time(), **extra}
+        table = pa.Table.from_pandas(frame)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), MARKER_KEY: json.dumps(marker)})
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            pq.write_table(table, tmp_path)
+            # ✅ Readers (other workers, the next start) only ever see a complete file
+            os.replace(tmp_path, self._path(name))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def delete(self, name):
+        """Remove the saved frame for name, if any"""
+        try:
+            os.unlink(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def load(self, name, source, loaded_after=None):
+        """(frame, marker) saved for name from source, or None when missing, outdated or from elsewhere.
+
+        With loaded_after, frames whose marker's loaded_at (wall-clock) is not later are skipped unread.
+        """
+        path = self._path(name)
+        try:
+            metadata = pq.read_schema(path).metadata or {}
+            marker = json.loads(metadata.get(MARKER_KEY, b"{}"))
+            if marker.get("format") != SNAPSHOT_FORMAT or marker.get("source") != source:
+                return None
+            if time.time() - marker.get("saved_at", 0) > self.max_age_seconds:
+                return None
+            if loaded_after is not None and marker.get("loaded_at", float("-inf")) <= loaded_after:
+                return None
+            # ✅ Copied out of the file's buffers: cached frames are patched in place, Arrow memory is read-only
+            return pq.read_table(path, memory_map=True).to_pandas().copy(), marker
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.exception(f"Ignoring unreadable snapshot file {path}")
+            return None
+
+
+_lock = threading.Lock()
+_store = None
+_configured = False
+
+
+def get_snapshot_store():
+    """Process-wide store in [snapshot] path, or None when [snapshot] enabled is off"""
+    global _store, _configured
+    with _lock:
+        if not _configured:
+            if str(get_setting("snapshot", "enabled", True)).strip().lower() not in ("0", "false", "no", "off"):
+                _store = SnapshotStore(
+                    get_setting("snapshot", "path", "faraja_snapshots"),
+                    float(get_setting("snapshot", "max_age_seconds", DEFAULT_MAX_AGE_SECONDS))
+                )
+            _configured = True
+        return _store
+
+
+def set_snapshot_store(store):
+    """Replace the process-wide store; None disables saving and warm starts (e.g. for benchmarks)"""
+    global _store, _configured
+    with _lock:
+        _store = store
+        _configured = True
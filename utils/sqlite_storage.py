@@ -0,0 +1,326 @@
+"""SQLite storage backend ([storage] backend = "sqlite") and the import that fills it.
+
+    python -m utils.sqlite_storage [--path FILE] [--generate SESSIONS BOOKINGS] [--replace]
+
+Imports the Sessions, Bookings and archived bookings of the Google Sheet, or generated test data.
+"""
+import argparse
+import logging
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+from utils.config import get_setting
+from utils.frames import normalize_bookings, normalize_sessions
+from utils.idempotency import operation
+from utils.indexes import SessionKey
+from utils.instrumentation import configure_logging
+from utils.storage import BOOKING_FIELDS, SESSION_FIELDS, StorageBackend
+
+logger = logging.getLogger("faraja.storage")
+
+# Sheet header -> SQLite column
+SESSION_COLUMNS = {
+    "Therapy Name": "therapy_name",
+    "Therapist Name": "therapist_name",
+    "Online or Physical": "online_or_physical",
+    "Date Available": "date_available",
+    "Start Time": "start_time",
+    "End Time": "end_time",
+    "Faraja Center Location": "location",
+    "Maximum Attendees": "maximum_attendees",
+    "Current Attendees": "current_attendees",
+    "Booking Status": "booking_status",
+}
+BOOKING_COLUMNS = {
+    "Name": "name",
+    "Attendee Type": "attendee_type",
+    "Gender": "gender",
+    "Phone": "phone",
+    "Therapy Name": "therapy_name",
+    "Therapist": "therapist",
+    "Date": "date",
+    "Time": "time",
+    "Faraja Center Location": "location",
+    "Online or Physical": "online_or_physical",
+    "Timestamp": "timestamp",
+    "is_cancelled": "is_cancelled",
+    "is_rescheduled": "is_rescheduled",
+    "reason": "reason",
+    "Alt Phone": "alt_phone",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    therapy_name TEXT NOT NULL,
+    therapist_name TEXT NOT NULL,
+    online_or_physical TEXT,
+    date_available TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    location TEXT,
+    maximum_attendees INTEGER NOT NULL DEFAULT 0,
+    current_attendees INTEGER NOT NULL DEFAULT 0,
+    booking_status TEXT NOT NULL DEFAULT 'Available',
+    UNIQUE (therapy_name, therapist_name, date_available, start_time, end_time)
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_date ON sessions (date_available);
+
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    attendee_type TEXT,
+    gender TEXT,
+    phone TEXT NOT NULL,
+    therapy_name TEXT,
+    therapist TEXT,
+    date TEXT,
+    time TEXT,
+    location TEXT,
+    online_or_physical TEXT,
+    timestamp TEXT,
+    is_cancelled INTEGER NOT NULL DEFAULT 0,
+    is_rescheduled INTEGER NOT NULL DEFAULT 0,
+    reason TEXT NOT NULL DEFAULT '',
+    alt_phone TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_bookings_phone_date ON bookings (phone, date);
+CREATE INDEX IF NOT EXISTS idx_bookings_session ON bookings (therapy_name, therapist, date, time);
+"""
+
+SESSION_KEY_SQL = "therapy_name = ? AND therapist_name = ? AND date_available = ? AND start_time = ? AND end_time = ?"
+
+# Keep the sheet's Available/Full semantics inside the UPDATE itself
+RELEASE_SEAT_SQL = f"""
+UPDATE sessions
+SET current_attendees = MAX(current_attendees - 1, 0),
+    booking_status = CASE WHEN MAX(current_attendees - 1, 0) < maximum_attendees THEN 'Available' ELSE 'Full' END
+WHERE {SESSION_KEY_SQL}
+"""
+TAKE_SEAT_SQL = """
+UPDATE sessions
+SET current_attendees = current_attendees + 1,
+    booking_status = CASE WHEN current_attendees + 1 >= maximum_attendees THEN 'Full' ELSE 'Available' END
+WHERE {where} AND current_attendees < maximum_attendees
+"""
+
+
+def _iso_dates(values):
+    return pd.to_datetime(values.astype(str).str.strip(), errors="coerce").dt.strftime("%Y-%m-%d")
+
+
+class SQLiteStorage(StorageBackend):
+    """Local SQLite database with the same sessions/bookings layout as the spreadsheet"""
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # ✅ One short-lived connection per call keeps this safe across Streamlit threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _select(self, table, columns, where="", params=()):
+        select = ", ".join(f'{column} AS "{header}"' for header, column in columns.items())
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(f"SELECT id, {select} FROM {table} {where} ORDER BY id", conn, params=params)
+        return df.set_index("id").rename_axis(None)
+
+    def is_empty(self):
+        """Whether neither sessions nor bookings have been imported yet"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT EXISTS (SELECT 1 FROM sessions) OR EXISTS (SELECT 1 FROM bookings)").fetchone()
+        return not row[0]
+
+    def clear(self):
+        """Delete every session and booking"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM bookings")
+            conn.execute("DELETE FROM sessions")
+
+    def import_sessions(self, df):
+        """Append sessions from a DataFrame with the sheet's column names (raw or typed by utils.frames)"""
+        df = df[SESSION_FIELDS].copy()
+        # ✅ Sessions are looked up by SessionKey, whose dates are ISO
+        df["Date Available"] = _iso_dates(df["Date Available"])
+        self._import("sessions", SESSION_COLUMNS, df)
+
+    def import_bookings(self, df):
+        """Append bookings from a DataFrame with the Bookings sheet's column names (raw or typed)"""
+        df = df.reindex(columns=BOOKING_FIELDS)
+        df["Phone"] = df["Phone"].astype(str).str.strip().str.zfill(10)
+        df["Date"] = _iso_dates(df["Date"])
+        for flag in ("is_cancelled", "is_rescheduled"):
+            df[flag] = df[flag].astype(str).str.upper().eq("TRUE").astype(int)
+        df["reason"] = df["reason"].fillna("")
+        self._import("bookings", BOOKING_COLUMNS, df)
+
+    def _import(self, table, columns, df):
+        placeholders = ", ".join("?" for _ in columns)
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(f"INSERT INTO {table} ({', '.join(columns.values())}) VALUES ({placeholders})", rows)
+
+    def list_sessions(self, refresh=False):
+        return normalize_sessions(self._select("sessions", SESSION_COLUMNS))
+
+    def find_session(self, key):
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT id FROM sessions WHERE {SESSION_KEY_SQL}", tuple(key)).fetchone()
+        return None if row is None else row[0]
+
+    def list_bookings(self, phone=None, refresh=False):
+        if phone is None:
+            return normalize_bookings(self._select("bookings", BOOKING_COLUMNS))
+        return normalize_bookings(self._select("bookings", BOOKING_COLUMNS, "WHERE phone = ?", (phone,)))
+
+    def book(self, session_index, name, gender, attendee_type, phone, alt_phone=None, request_key=None):
+        # ✅ Each operation is one transaction, so a keyed retry only needs the first result replayed
+        with operation(request_key, "book") as op:
+            if op.done:
+                return op.result
+            status = self._book(session_index, name, gender, attendee_type, phone, alt_phone)
+            return op.finish(status) if status == "Success" else status
+
+    def _book(self, session_index, name, gender, attendee_type, phone, alt_phone=None):
+        try:
+            with closing(self._connect()) as conn, conn:
+                taken = conn.execute(TAKE_SEAT_SQL.format(where="id = ?"), (int(session_index),)).rowcount
+                if not taken:
+                    return "Full"
+                session = conn.execute(
+                    "SELECT therapy_name, therapist_name, date_available, start_time, end_time, location, "
+                    "online_or_physical FROM sessions WHERE id = ?", (int(session_index),)
+                ).fetchone()
+                self._insert_booking(conn, name, gender, attendee_type, phone, session, alt_phone)
+            return "Success"
+
+        except Exception as e:
+            logger.exception(f"❌ Error booking session in SQLite: {e}")
+            return "Error"
+
+    def _insert_booking(self, conn, name, gender, attendee_type, phone, session, alt_phone=None):
+        therapy_name, therapist_name, date, start_time, end_time, location, online_or_physical = session
+        conn.execute(
+            "INSERT INTO bookings (name, attendee_type, gender, phone, therapy_name, therapist, date, time, "
+            "location, online_or_physical, timestamp, alt_phone) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                name, attendee_type, gender, str(phone), therapy_name, therapist_name, date,
+                f"{start_time} - {end_time}", location, online_or_physical,
+                pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S"), alt_phone
+            )
+        )
+
+    def _release(self, conn, selected_session, flag_column, reason):
+        """Flag the booking and free its seat inside an open transaction; False if not found"""
+        key = SessionKey.from_booking(selected_session)
+        row = conn.execute(
+            "SELECT id FROM bookings WHERE phone = ? AND therapy_name = ? AND therapist = ? AND date = ? "
+            "AND time = ? AND is_cancelled = 0 AND is_rescheduled = 0 ORDER BY id LIMIT 1",
+            (
+                str(selected_session["Phone"]), key.therapy_name, key.therapist_name, key.date,
+                selected_session["Time"]
+            )
+        ).fetchone()
+        if row is None:
+            logger.warning("❌ No matching session found in bookings table.")
+            return False
+
+        conn.execute(f"UPDATE bookings SET {flag_column} = 1, reason = ? WHERE id = ?", (reason, row[0]))
+        conn.execute(RELEASE_SEAT_SQL, tuple(key))
+        return True
+
+    def cancel(self, selected_session, reason, request_key=None):
+        with operation(request_key, "cancel") as op:
+            if op.done:
+                return op.result
+            status = self._cancel(selected_session, reason)
+            return op.finish(status) if status == "Success" else status
+
+    def _cancel(self, selected_session, reason):
+        try:
+            with closing(self._connect()) as conn, conn:
+                return "Success" if self._release(conn, selected_session, "is_cancelled", reason) else "Error"
+
+        except Exception as e:
+            logger.exception(f"❌ Error cancelling booking: {e}")
+            return "Error"
+
+    def reschedule(self, selected_session, reason, new_session, request_key=None):
+        with operation(request_key, "reschedule") as op:
+            if op.done:
+                return op.result
+            status = self._reschedule(selected_session, reason, new_session)
+            return op.finish(status) if status == "Success" else status
+
+    def _reschedule(self, selected_session, reason, new_session):
+        try:
+            with closing(self._connect()) as conn, conn:
+                if not self._release(conn, selected_session, "is_rescheduled", reason):
+                    return "Error"
+
+                key = SessionKey.from_session(new_session)
+                if not conn.execute(TAKE_SEAT_SQL.format(where=SESSION_KEY_SQL), tuple(key)).rowcount:
+                    # ✅ Raising rolls back the release so the old seat is kept
+                    raise ValueError("the new session is already full")
+
+                self._insert_booking(
+                    conn, selected_session["Name"], selected_session["Gender"], selected_session["Attendee Type"],
+                    selected_session["Phone"],
+                    tuple(key) + (new_session["Faraja Center Location"], new_session["Online or Physical"])
+                )
+            return "Success"
+
+        except Exception as e:
+            logger.exception(f"❌ Error rescheduling booking: {e}")
+            return "Error"
+
+
+def sheet_frames():
+    """(sessions, bookings) of the Google Sheet, archived bookings first so ids follow booking order"""
+    from utils.gsheet import get_archived_bookings, get_bookings, get_sessions, get_worksheet
+
+    bookings = pd.concat([get_archived_bookings(), get_bookings(refresh=True)], ignore_index=True)
+    return get_sessions(get_worksheet(), refresh=True), bookings
+
+
+def generated_frames(n_sessions, n_bookings, seed=0):
+    """(sessions, bookings) generated by benchmarks.datagen"""
+    from benchmarks.datagen import make_bookings, make_sessions
+
+    sessions = make_sessions(n_sessions, seed=seed)
+    return (
+        pd.DataFrame(sessions, columns=SESSION_FIELDS),
+        pd.DataFrame(make_bookings(n_bookings, sessions, seed), columns=BOOKING_FIELDS)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", help="database file (default: [storage] sqlite_path)")
+    parser.add_argument(
+        "--generate", nargs=2, type=int, metavar=("SESSIONS", "BOOKINGS"),
+        help="import generated data instead of the spreadsheet"
+    )
+    parser.add_argument("--replace", action="store_true", help="delete the sessions and bookings already imported")
+    args = parser.parse_args()
+    configure_logging()
+
+    storage = SQLiteStorage(args.path or get_setting("storage", "sqlite_path", "faraja.db"))
+    if not storage.is_empty():
+        if not args.replace:
+            parser.error(f"{storage.path} already holds sessions or bookings; pass --replace to overwrite them")
+        storage.clear()
+
+    sessions, bookings = generated_frames(*args.generate) if args.generate else sheet_frames()
+    storage.import_sessions(sessions)
+    storage.import_bookings(bookings)
+    logger.info(f"Imported {len(sessions)} sessions and {len(bookings)} bookings into {storage.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import threading
+
+import pandas as pd
+
+from utils.config import get_setting
+from utils.indexes import PhoneIndex
+from utils.intervals import BookingIntervals
+
+# Column layout shared by every backend, matching the Google Sheets tabs
+SESSION_FIELDS = [
+    "Therapy Name", "Therapist Name", "Online or Physical", "Date Available", "Start Time",
+    "End Time", "Faraja Center Location", "Maximum Attendees", "Current Attendees", "Booking Status"
+]
+BOOKING_FIELDS = [
+    "Name", "Attendee Type", "Gender", "Phone", "Therapy Name",
+    "Therapist", "Date", "Time", "Faraja Center Location", "Online or Physical",
+    "Timestamp", "is_cancelled", "is_rescheduled", "reason", "Alt Phone"
+]
+# Columns of list_failed_writes: the confirmed action and the booking it was about
+FAILED_WRITE_FIELDS = ["Action", "Therapy Name", "Therapist", "Date", "Time", "Problem"]
+
+
+class StorageBackend:
+    """Interface for where sessions and bookings live; frames use the sheet column names, typed by utils.frames"""
+
+    def connect(self):
+        """Open (or reuse) whatever connection the backend needs; a no-op by default"""
+
+    def list_sessions(self, refresh=False):
+        """Return all sessions as a DataFrame whose index identifies each session"""
+        raise NotImplementedError
+
+    def find_session(self, key):
+        """Return the index of the session identified by a SessionKey, or None"""
+        raise NotImplementedError
+
+    def list_bookings(self, phone=None, refresh=False):
+        """Return live bookings as a DataFrame, optionally only those for phone"""
+        raise NotImplementedError
+
+    def find_overlapping_bookings(self, phone, starts_at, ends_at, refresh=False):
+        """Return phone's active bookings whose time overlaps [starts_at, ends_at) (a session's Starts/Ends At)"""
+        bookings = self.list_bookings(phone=phone, refresh=refresh)
+        return bookings.loc[BookingIntervals(bookings, PhoneIndex(bookings)).overlapping(phone, starts_at, ends_at)]
+
+    def list_archived_bookings(self, phone=None):
+        """Return past bookings moved out of the live set (see utils.archive); none unless the backend archives"""
+        return pd.DataFrame(columns=BOOKING_FIELDS)
+
+    def list_failed_writes(self, phone):
+        """Return phone's writes that were confirmed but could not be made after all (FAILED_WRITE_FIELDS);
+        none unless the backend confirms writes before making them"""
+        return pd.DataFrame(columns=FAILED_WRITE_FIELDS)
+
+    # Write operations take an optional request_key (see utils.idempotency.request_key): a retry with the
+    # same key resumes or replays the first attempt instead of applying it twice.
+
+    def book(self, session_index, name, gender, attendee_type, phone, alt_phone=None, request_key=None):
+        """Take a seat on a session and record the booking; returns "Success", "Full" or "Error" """
+        raise NotImplementedError
+
+    def cancel(self, selected_session, reason, request_key=None):
+        """Flag a booking (a row from list_bookings) cancelled and free its seat; "Success" or "Error" """
+        raise NotImplementedError
+
+    def reschedule(self, selected_session, reason, new_session, request_key=None):
+        """Flag a booking rescheduled and move its seat to new_session (a row from list_sessions); "Success" or "Error" """
+        raise NotImplementedError
+
+
+_lock = threading.Lock()
+_storage = None
+
+
+def get_storage():
+    """Return the process-wide backend selected by [storage] backend ("gsheets" or "sqlite").
+
+    The SQLite database starts empty; fill it with python -m utils.sqlite_storage (see there).
+
+    With [journal] enabled, Sheets writes are confirmed from a local write-ahead journal and flushed
+    in the background (see utils.journaled_storage).
+    """
+    global _storage
+    with _lock:
+        if _storage is None:
+            backend = get_setting("storage", "backend", "gsheets")
+            if backend == "sqlite":
+                from utils.sqlite_storage import SQLiteStorage
+                _storage = SQLiteStorage(get_setting("storage", "sqlite_path", "faraja.db"))
+            elif backend == "gsheets":
+                from utils.journaled_storage import journal_enabled, journaled
+                from utils.sheets_storage import SheetsStorage
+                _storage = journaled(SheetsStorage()) if journal_enabled() else SheetsStorage()
+            else:
+                raise ValueError(f"Unknown storage backend: {backend}")
+        return _storage